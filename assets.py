@@ -0,0 +1,47 @@
+import pygame
+
+from config import BLOCK_SIZE, ELEMENTS
+from physics import PORTAL_TYPES
+from utils import load_image
+
+
+class ElementAsset:
+    """The image and mask of one kind of element. These never change, so every
+    sprite of the element shares them.
+    """
+
+    def __init__(self, id: str):
+        """Loads the element's image and mask.
+
+        Args:
+            id (str): The element id, a key of ELEMENTS.
+        """
+        self.collision_type = ELEMENTS[id]["collision_type"]
+
+        # Portals are 3 tiles tall and are drawn from 2 tiles above and to the
+        # left of their cell
+        is_portal = self.collision_type in PORTAL_TYPES
+        size = BLOCK_SIZE * (3 if is_portal else 1)
+        self.offset = BLOCK_SIZE * (2 if is_portal else 0)
+
+        self.image = load_image(ELEMENTS[id]["filename"], (size, size))
+        self.mask = pygame.mask.from_surface(self.image) if self.image else None
+
+
+# dict from element id to ElementAsset
+element_assets = {}
+
+
+def get_element_asset(id: str):
+    """Returns the shared asset for an element, loading it the first time.
+
+    Args:
+        id (str): The element id, a key of ELEMENTS.
+
+    Returns:
+        ElementAsset: The element's asset.
+    """
+    asset = element_assets.get(id)
+    if asset is None:
+        asset = element_assets[id] = ElementAsset(id)
+    return asset
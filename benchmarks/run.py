@@ -0,0 +1,335 @@
+"""Times the hot paths of the game and the AI on the real maps.
+
+Run from the root of the repo:
+
+    python -m benchmarks.run                  # compare against the baseline
+    python -m benchmarks.run --save-baseline  # e.g. before making a change
+    python -m benchmarks.run --only draw player_update
+
+The results are printed as a table and written as JSON. Each benchmark is
+compared against the baseline, if there is one, and the exit code is 1 when
+any of them got slower by more than the threshold. Timings depend on the
+machine, so a baseline is only meaningful on the machine that saved it.
+"""
+
+import argparse
+from functools import lru_cache
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Draw into memory when there is no display, e.g. on a server
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+from config import LEVELS, SCREEN_SIZE
+from game import Game
+from jump_controller import JumpControllerAI
+from physics import check_collisions_x, check_collisions_y
+from population import Population
+from utils import load_map, parse_map
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILENAME = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_FILENAME = os.path.join(BENCHMARK_DIR, "results.json")
+
+# Every benchmark is seeded so that it does the same work on every run
+SEED = 0
+NUM_PLAYERS = 20
+# The per-frame benchmarks replay at most this many frames of the level
+MAX_FRAMES = 3000
+DRAW_FRAMES = 300
+
+
+def measure(fn, repeat: int, setup=None):
+    """Calls fn repeat times and times each call.
+
+    Args:
+        fn (function): The code to time. It is given the return value of
+            setup, if there is one.
+        repeat (int): The number of timed calls.
+        setup (function, optional): Called before each call and not timed.
+            Defaults to None.
+
+    Returns:
+        list[float]: The time of each call in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+@lru_cache(maxsize=None)
+def get_trajectory(level_id: int):
+    """Plays one AI player through a level and records what it did, so the
+    per-frame benchmarks can replay the same frames.
+
+    Args:
+        level_id (int): The index of the level in LEVELS.
+
+    Returns:
+        tuple: (game, states, jumps). game is the headless game the player was
+            in, reset to the start. states[i] is the state of the player before
+            frame i and jumps[i] whether it jumped on that frame.
+    """
+    game = Game(load_map(level_id), 0, 1, headless=True, seed=SEED)
+    player = game.player_sprite_group.sprites()[0]
+    states, jumps = [], []
+    while not (player.dead or player.won) and len(states) < MAX_FRAMES:
+        states.append(player.snapshot())
+        player.should_jump = player.jump_controller.should_jump(
+            player.state, game.level
+        )
+        jumps.append(player.should_jump)
+        player.update(game.level)
+    game.reset()
+    return game, states, jumps
+
+
+def bench_load_map(level_id: int, repeat: int):
+    load_map(level_id)  # make sure the compiled map is up to date
+    return measure(lambda: load_map(level_id), repeat), 1
+
+
+def bench_parse_map(level_id: int, repeat: int):
+    filename = LEVELS[level_id]["filename"]
+    return measure(lambda: parse_map(filename), repeat), 1
+
+
+def bench_game_init(level_id: int, repeat: int):
+    map = load_map(level_id)
+    times = measure(
+        lambda: Game(map, 0, NUM_PLAYERS, headless=True, seed=SEED), repeat
+    )
+    return times, 1
+
+
+def bench_game_init_render(level_id: int, repeat: int):
+    map = load_map(level_id)
+    return measure(lambda: Game(map, 0, NUM_PLAYERS, seed=SEED), repeat), 1
+
+
+def bench_player_update(level_id: int, repeat: int):
+    game, _, jumps = get_trajectory(level_id)
+    player = game.player_sprite_group.sprites()[0]
+
+    def replay(player):
+        for jump in jumps:
+            player.should_jump = jump
+            player.update(game.level)
+
+    def setup():
+        player.reset()
+        return player
+
+    return measure(replay, repeat, setup), len(jumps)
+
+
+def bench_check_collisions(check_collisions):
+    def bench(level_id: int, repeat: int):
+        game, states, _ = get_trajectory(level_id)
+
+        def check_all(states):
+            for state in states:
+                check_collisions(state, game.level)
+
+        # The checks change the states, so each call gets fresh copies
+        setup = lambda: [state.copy() for state in states]
+        return measure(check_all, repeat, setup), len(states)
+
+    return bench
+
+
+def bench_should_jump(level_id: int, repeat: int):
+    game, states, _ = get_trajectory(level_id)
+
+    def decide_all(jump_controller):
+        for state in states:
+            jump_controller.should_jump(state, game.level)
+
+    # A new controller each time, since it keeps its rollout between frames
+    setup = lambda: JumpControllerAI(rng=np.random.default_rng(SEED))
+    return measure(decide_all, repeat, setup), len(states)
+
+
+def bench_ga_generation(level_id: int, repeat: int):
+    map = load_map(level_id)
+
+    def setup():
+        # The players jump when their nets say so, like in train.py
+        population = Population(NUM_PLAYERS, rng=np.random.default_rng(SEED))
+        game = Game(
+            map, 0, NUM_PLAYERS, headless=True, nets=population.nets, use_net=True
+        )
+        return population, game
+
+    def generation(args):
+        population, game = args
+        results = game.simulate_generation(MAX_FRAMES)
+        population.evolve([result.score for result in results])
+
+    return measure(generation, repeat, setup), 1
+
+
+def bench_draw(level_id: int, repeat: int):
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    game = Game(load_map(level_id), 0, NUM_PLAYERS, seed=SEED)
+
+    # Only the drawing is timed, not the updates between the frames
+    times = []
+    for _ in range(repeat):
+        game.reset()
+        total = 0
+        for frame in range(DRAW_FRAMES):
+            game.update()
+            start = time.perf_counter()
+            game.draw(screen, 1, frame / 60, frame / 60, True)
+            total += time.perf_counter() - start
+        times.append(total)
+    return times, DRAW_FRAMES
+
+
+# Each benchmark returns (times, items) where items is the number of things
+# (frames, states, ...) that each timed call did
+BENCHMARKS = {
+    "load_map": bench_load_map,
+    "parse_map": bench_parse_map,
+    "game_init": bench_game_init,
+    "game_init_render": bench_game_init_render,
+    "player_update": bench_player_update,
+    "check_collisions_x": bench_check_collisions(check_collisions_x),
+    "check_collisions_y": bench_check_collisions(check_collisions_y),
+    "should_jump": bench_should_jump,
+    "ga_generation": bench_ga_generation,
+    "draw": bench_draw,
+}
+
+
+def run(level_id: int, repeat: int, names: list[str]):
+    """Runs the benchmarks.
+
+    Args:
+        level_id (int): The index of the level in LEVELS to run them on.
+        repeat (int): How many times to time each benchmark.
+        names (list[str]): The names of the benchmarks to run.
+
+    Returns:
+        dict: The results, in the format that is saved as JSON.
+    """
+    benchmarks = {}
+    for name in names:
+        times, items = BENCHMARKS[name](level_id, repeat)
+        median = statistics.median(times)
+        benchmarks[name] = {
+            "median": median,
+            "min": min(times),
+            "items": items,
+            "per_second": items / median if median else None,
+        }
+    return {
+        "level_id": level_id,
+        "repeat": repeat,
+        "system": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+        },
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Prints the results next to the baseline.
+
+    Args:
+        results (dict): The results of run().
+        baseline (dict): Earlier results of run(), or None.
+        threshold (float): How much slower than the baseline a benchmark can
+            get before it counts as a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list[str]: The names of the benchmarks that regressed.
+    """
+    if baseline and baseline["level_id"] != results["level_id"]:
+        print(f"The baseline is for level {baseline['level_id']}, not comparing")
+        baseline = None
+    baseline_benchmarks = baseline["benchmarks"] if baseline else {}
+
+    regressions = []
+    print(f"{'benchmark':<20}{'median':>12}{'per second':>14}{'vs baseline':>14}")
+    for name, result in results["benchmarks"].items():
+        line = (
+            f"{name:<20}{1000 * result['median']:>10.2f}ms"
+            f"{result['per_second']:>14,.0f}"
+        )
+        if name in baseline_benchmarks:
+            ratio = result["median"] / baseline_benchmarks[name]["median"]
+            line += f"{ratio:>13.2f}x"
+            if ratio > 1 + threshold:
+                line += "  SLOWER"
+                regressions.append(name)
+            elif ratio < 1 / (1 + threshold):
+                line += "  faster"
+        print(line)
+    return regressions
+
+
+def save_json(filename: str, data: dict):
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the game and the AI.")
+    parser.add_argument(
+        "--level", type=int, default=0, choices=range(len(LEVELS)), dest="level_id"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--output", default=RESULTS_FILENAME)
+    parser.add_argument("--baseline", default=BASELINE_FILENAME)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Also save the results as the new baseline.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="How much slower counts as a regression. Defaults to 0.1 (10%%).",
+    )
+    args = parser.parse_args()
+
+    pygame.init()
+    results = run(args.level_id, args.repeat, list(args.only))
+    save_json(args.output, results)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        save_json(args.baseline, results)
+        print(f"Saved the baseline to {args.baseline}")
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
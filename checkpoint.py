@@ -0,0 +1,102 @@
+import json
+import os
+
+import numpy as np
+
+from jump_controller import get_genome, net_from_genome
+from population import Population
+
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+def get_checkpoint_filename(level_id: int, simulate: bool = False):
+    """Returns the checkpoint file of a level. train.py and the Simulate screen
+    evolve different populations, so each has its own file and neither
+    overwrites the other's training.
+
+    Args:
+        level_id (int): The index of the level in LEVELS.
+        simulate (bool, optional): Whether to return the file of the Simulate
+            screen instead of train.py's. Defaults to False.
+
+    Returns:
+        str: The path of the .npz file.
+    """
+    prefix = "simulate-level" if simulate else "level"
+    return os.path.join(CHECKPOINT_DIR, f"{prefix}-{level_id}.npz")
+
+
+def save_checkpoint(filename: str, population: Population, total_time: float = 0):
+    """Saves everything needed to resume training: the genomes, the GA settings,
+    the generation, the best net and the state of the population's random
+    number generator. The file is replaced atomically, so a crash while saving
+    keeps the previous checkpoint.
+
+    Args:
+        filename (str): The .npz file to write.
+        population (Population): The population to save.
+        total_time (float, optional): How long the training has run for, in
+            seconds. Defaults to 0.
+    """
+    has_best = population.best_net is not None
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "wb") as f:
+        np.savez(
+            f,
+            genomes=population.genomes,
+            generation=population.generation,
+            best_score=population.best_score if has_best else 0,
+            best_genome=get_genome(population.best_net) if has_best else [],
+            num_elites=population.num_elites,
+            selection=population.selection,
+            tournament_size=population.tournament_size,
+            crossover_rate=population.crossover_rate,
+            mutation_strength=population.mutation_strength,
+            mutation_freq=population.mutation_freq,
+            mutation_decay=population.mutation_decay,
+            min_mutation_strength=population.min_mutation_strength,
+            # The state holds 128-bit ints, which JSON can store exactly
+            rng_state=json.dumps(population.rng.bit_generator.state),
+            total_time=total_time,
+        )
+    os.replace(tmp_filename, filename)
+
+
+def load_checkpoint(filename: str):
+    """Loads a checkpoint written by save_checkpoint(), including the state of
+    the random number generator, so training continues as if it had never
+    stopped.
+
+    Args:
+        filename (str): The .npz file to read.
+
+    Returns:
+        tuple: (population, total_time).
+    """
+    with np.load(filename) as checkpoint:
+        genomes = checkpoint["genomes"]
+        population = Population(
+            len(genomes),
+            num_elites=int(checkpoint["num_elites"]),
+            selection=str(checkpoint["selection"]),
+            tournament_size=int(checkpoint["tournament_size"]),
+            crossover_rate=float(checkpoint["crossover_rate"]),
+            mutation_strength=float(checkpoint["mutation_strength"]),
+            mutation_freq=float(checkpoint["mutation_freq"]),
+            mutation_decay=float(checkpoint["mutation_decay"]),
+            min_mutation_strength=float(checkpoint["min_mutation_strength"]),
+            rng=np.random.default_rng(),
+        )
+        population.set_genomes(genomes)
+        population.generation = int(checkpoint["generation"])
+        if len(checkpoint["best_genome"]):
+            population.best_net = net_from_genome(checkpoint["best_genome"])
+            population.best_score = float(checkpoint["best_score"])
+
+        # Restored last since creating the population above uses the RNG
+        population.rng.bit_generator.state = json.loads(str(checkpoint["rng_state"]))
+        total_time = float(checkpoint["total_time"])
+    return population, total_time
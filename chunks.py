@@ -0,0 +1,135 @@
+from __future__ import annotations
+from collections import OrderedDict
+import math
+from typing import TYPE_CHECKING, Callable
+
+import pygame
+
+from config import BLOCK_SIZE, CHUNK_BLOCKS, MAX_CHUNKS, SCREEN_SIZE
+from utils import premultiply_alpha
+
+if TYPE_CHECKING:
+    from game import Camera
+    from sprites.basic import ElementSprite
+
+
+class ChunkCache:
+    """The elements of a level pre-rendered into surfaces that are
+    CHUNK_BLOCKS tiles wide. The elements never move, so drawing the level is
+    a couple of large blits instead of one small blit per element.
+
+    Chunks are rendered the first time they are needed (and one ahead of the
+    camera), and the least recently used ones are dropped once there are more
+    than MAX_CHUNKS.
+
+    Everything is blended with premultiplied alpha, since blending the
+    semi-transparent parts of elements (like portals) onto a transparent chunk
+    and then onto the screen would otherwise darken them.
+    """
+
+    def __init__(
+        self,
+        elements: list[ElementSprite],
+        get_elements: Callable[[int, int], list[ElementSprite]],
+        max_chunks: int = MAX_CHUNKS,
+    ):
+        """Creates an empty cache.
+
+        Args:
+            elements (list[ElementSprite]): All the elements of the level.
+            get_elements (Callable[[int, int], list[ElementSprite]]): Returns
+                the elements that can be drawn between two x positions, in the
+                order to draw them in, e.g. Game.get_elements().
+            max_chunks (int, optional): The number of chunks to keep. Defaults
+                to MAX_CHUNKS.
+        """
+        self.get_elements = get_elements
+        self.max_chunks = max_chunks
+        self.width = CHUNK_BLOCKS * BLOCK_SIZE
+
+        # The chunks span the bounding box of all the elements
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+        if elements:
+            self.bounds = elements[0].rect.unionall(
+                [element.rect for element in elements[1:]]
+            )
+        self.first_chunk = math.floor(self.bounds.left / self.width)
+        self.last_chunk = math.floor((self.bounds.right - 1) / self.width)
+
+        # dict from chunk index to surface, from least to most recently used
+        self.chunks = OrderedDict()
+        # dict from element image to its premultiplied copy
+        self.premultiplied_images = {}
+
+    def get_premultiplied_image(self, image: pygame.Surface):
+        premultiplied_image = self.premultiplied_images.get(image)
+        if premultiplied_image is None:
+            premultiplied_image = self.premultiplied_images[image] = (
+                premultiply_alpha(image)
+            )
+        return premultiplied_image
+
+    def get_chunk(self, i: int):
+        """Returns a chunk, rendering it if it is not in the cache.
+
+        Args:
+            i (int): The index of the chunk. Chunk i starts at x = i * width.
+
+        Returns:
+            pygame.Surface: The chunk. Its top is at y = bounds.top.
+        """
+        chunk = self.chunks.get(i)
+        if chunk is not None:
+            self.chunks.move_to_end(i)
+            return chunk
+
+        left = i * self.width
+        chunk = pygame.Surface((self.width, self.bounds.height), pygame.SRCALPHA)
+        chunk.blits(
+            [
+                (
+                    self.get_premultiplied_image(element.image),
+                    element.rect.move(-left, -self.bounds.top),
+                    None,
+                    pygame.BLEND_PREMULTIPLIED,
+                )
+                for element in self.get_elements(left, left + self.width)
+            ],
+            doreturn=False,
+        )
+
+        self.chunks[i] = chunk
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def draw(self, screen: pygame.Surface, camera: Camera):
+        """Draws the chunks that the camera can see.
+
+        Args:
+            screen (pygame.Surface): The surface to draw on.
+            camera (Camera): The camera.
+        """
+        if not self.bounds.height:
+            return
+        first = max(self.first_chunk, math.floor(camera.x / self.width))
+        last = min(
+            self.last_chunk, math.floor((camera.x + SCREEN_SIZE[0] - 1) / self.width)
+        )
+        y = self.bounds.top - camera.y
+        screen.blits(
+            [
+                (
+                    self.get_chunk(i),
+                    (i * self.width - camera.x, y),
+                    None,
+                    pygame.BLEND_PREMULTIPLIED,
+                )
+                for i in range(first, last + 1)
+            ],
+            doreturn=False,
+        )
+
+        # Render the next chunk before the camera reaches it
+        if self.first_chunk <= last + 1 <= self.last_chunk:
+            self.get_chunk(last + 1)
@@ -31,17 +31,23 @@ class Button:
         self.border_radius = border_radius
 
     def draw(self, screen):
+        """Draws the button, highlighted if the mouse is over it.
+
+        Returns:
+            pygame.Rect: The part of the screen that was drawn on.
+        """
         # Check if the mouse is hovering over the button
         mouse_pos = pygame.mouse.get_pos()
         color = self.hover_color if self.rect.collidepoint(mouse_pos) else self.color
 
-        RoundedRect(
+        background_rect = RoundedRect(
             self.x, self.y, self.width, self.height, color, self.border_radius
         ).draw(screen)
 
-        Text(
+        text_rect = Text(
             self.text,
             self.font_size,
             self.text_color,
             center=(self.x + self.width // 2, self.y + self.height // 2),
         ).draw(screen)
+        return background_rect.union(text_rect)
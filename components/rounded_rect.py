@@ -22,29 +22,34 @@ class RoundedRect:
         self.border_radius = border_radius
 
     def draw(self, screen):
+        """Draws the rect.
+
+        Returns:
+            pygame.Rect: The part of the screen that was drawn on.
+        """
         # top left corner
-        pygame.draw.circle(
+        top_left = pygame.draw.circle(
             screen,
             self.color,
             (self.x + self.border_radius, self.y + self.border_radius),
             self.border_radius,
         )
         # top right corner
-        pygame.draw.circle(
+        top_right = pygame.draw.circle(
             screen,
             self.color,
             (self.x + self.width - self.border_radius, self.y + self.border_radius),
             self.border_radius,
         )
         # bottom left corner
-        pygame.draw.circle(
+        bottom_left = pygame.draw.circle(
             screen,
             self.color,
             (self.x + self.border_radius, self.y + self.height - self.border_radius),
             self.border_radius,
         )
         # bottom right corner
-        pygame.draw.circle(
+        bottom_right = pygame.draw.circle(
             screen,
             self.color,
             (
@@ -54,7 +59,7 @@ class RoundedRect:
             self.border_radius,
         )
 
-        pygame.draw.rect(
+        vertical_bar = pygame.draw.rect(
             screen,
             self.color,
             (
@@ -65,7 +70,7 @@ class RoundedRect:
             ),
             0,
         )
-        pygame.draw.rect(
+        horizontal_bar = pygame.draw.rect(
             screen,
             self.color,
             (
@@ -76,3 +81,6 @@ class RoundedRect:
             ),
             0,
         )
+        return vertical_bar.unionall(
+            [horizontal_bar, top_left, top_right, bottom_left, bottom_right]
+        )
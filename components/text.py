@@ -1,9 +1,60 @@
+from collections import OrderedDict
 from typing import Tuple
 
 import pygame
 
 pygame.Rect
 
+# How many rendered strings to keep. The HUD redraws the same few strings
+# every frame, and the timers and scores make a new one most frames.
+MAX_RENDERED_TEXTS = 256
+
+# dict from font size to font
+fonts = {}
+# dict from (text, font size, color) to rendered surface, from least to most
+# recently used
+rendered_texts = OrderedDict()
+
+
+def get_font(font_size: int):
+    """Returns the default font in a size, opening it the first time.
+
+    Args:
+        font_size (int): The font size.
+
+    Returns:
+        pygame.font.Font: The font.
+    """
+    font = fonts.get(font_size)
+    if font is None:
+        font = fonts[font_size] = pygame.font.Font(None, font_size)
+    return font
+
+
+def render_text(text: str, font_size: int, color: Tuple[int, int, int]):
+    """Renders a string with the default font. The last MAX_RENDERED_TEXTS
+    strings are cached, so drawing the same text every frame only renders it
+    once. The surface is shared, so do not draw on it.
+
+    Args:
+        text (str): The text.
+        font_size (int): The font size.
+        color (Tuple[int, int, int]): The color of the text.
+
+    Returns:
+        pygame.Surface: The rendered text.
+    """
+    key = (text, font_size, tuple(color))
+    surface = rendered_texts.get(key)
+    if surface is not None:
+        rendered_texts.move_to_end(key)
+        return surface
+
+    surface = rendered_texts[key] = get_font(font_size).render(text, True, color)
+    if len(rendered_texts) > MAX_RENDERED_TEXTS:
+        rendered_texts.popitem(last=False)
+    return surface
+
 
 class Text:
     def __init__(
@@ -62,8 +113,7 @@ class Text:
         self.h = h
 
     def draw(self, screen):
-        font = pygame.font.Font(None, self.font_size)
-        text = font.render(self.text, True, self.color)
+        text = render_text(self.text, self.font_size, self.color)
 
         rect = text.get_rect()
         if self.x:
@@ -111,4 +161,4 @@ class Text:
         if self.h:
             rect.h = self.h
 
-        screen.blit(text, rect)
+        return screen.blit(text, rect)
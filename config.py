@@ -6,6 +6,10 @@ TITLE = "Geometry Dash AI"
 BLOCK_SIZE = 32
 SCREEN_BLOCKS = (25, 18)
 SCREEN_SIZE = tuple(x * BLOCK_SIZE for x in SCREEN_BLOCKS)
+# The level is pre-rendered in chunks this many tiles wide, and this many of
+# them are kept (enough for the screen and the next chunk)
+CHUNK_BLOCKS = 16
+MAX_CHUNKS = 4
 
 # Player
 GRAVITY = 0.86
@@ -14,6 +18,26 @@ VELOCITY_MAX_FALL = 100
 VELOCITY_JUMP = 10
 VELOCITY_JUMP_PAD = 15
 VELOCITY_JUMP_ORB = 8
+# Headless games move their players with one batched step (see
+# physics_batch.py) when at least this many are alive. Below this, stepping the
+# players one by one is faster.
+BATCH_PHYSICS_MIN_PLAYERS = 150
+
+# AI
+# Whether the AI players jump when their nets say so by default. When False,
+# they follow the hand-written rules in JumpControllerAI.should_jump(). Training
+# (train.py and the Simulate screen) always uses the nets.
+AI_USE_NET = False
+# "numpy" or "torch". torch is only imported when it is chosen here.
+AI_NET_BACKEND = "numpy"
+# How many generations to train between checkpoints
+CHECKPOINT_INTERVAL = 5
+# The most frames a generation of the Simulate screen runs for. Players that
+# are still running then are scored by how far they got. None for no limit.
+SIMULATE_MAX_FRAMES = None
+# Seed for the game and the GA, so that runs can be repeated exactly. None
+# gives a different run each time.
+SEED = None
 
 # Levels
 LEVELS = [
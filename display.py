@@ -0,0 +1,41 @@
+import pygame
+
+
+class DirtyRects:
+    """Pushes only the parts of the screen that were redrawn to the display,
+    instead of the whole window. This matters on displays that are slow to
+    update, like software-rendered desktops and VNC.
+
+    The widgets report the rects they drew (their draw() returns them), and
+    the loop adds the ones that can change between frames, e.g. a button's
+    hover or a timer. The rects of the last frame are pushed again, so that a
+    widget that shrank, moved or went away is cleared too. Loops that know the
+    whole screen changed (e.g. the level scrolling) should pass full=True.
+    """
+
+    def __init__(self):
+        """Creates the tracker. The first update pushes the whole screen."""
+        self.rects = []  # the rects added since the last update
+        self.previous_rects = None  # the rects of the last update
+
+    def add(self, *rects: pygame.Rect):
+        """Marks parts of the screen as redrawn this frame.
+
+        Args:
+            rects (pygame.Rect): The rects that were drawn.
+        """
+        self.rects.extend(rects)
+
+    def update(self, full: bool = False):
+        """Pushes the rects added since the last update to the display. Call
+        this instead of pygame.display.flip().
+
+        Args:
+            full (bool, optional): Whether the whole screen changed. Defaults to
+                False.
+        """
+        if full or self.previous_rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.previous_rects + self.rects)
+        self.previous_rects, self.rects = self.rects, []
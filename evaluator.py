@@ -0,0 +1,124 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from game import Game, PlayerResult
+from jump_controller import JumpControllerAI, get_genome, net_from_genome
+
+if TYPE_CHECKING:
+    from jump_controller import Net
+
+
+# Set up in each worker process by init_worker()
+worker_map = None
+worker_max_frames = None
+# dict from number of players to a headless game with that many AI players
+worker_games = {}
+
+
+def init_worker(map: np.ndarray, max_frames: int):
+    """Receives the level once when a worker process starts.
+
+    Args:
+        map (np.ndarray): 2D array where each element is a tile id.
+        max_frames (int): The maximum number of frames to simulate.
+    """
+    global worker_map, worker_max_frames
+    worker_map = map
+    worker_max_frames = max_frames
+
+
+def evaluate_batch(genomes: np.ndarray):
+    """Plays one batch of individuals through the worker's level.
+
+    Args:
+        genomes (np.ndarray): Matrix with the genome of each individual's Net
+            per row.
+
+    Returns:
+        list[PlayerResult]: One result per individual, without the player.
+    """
+    # Games are reused so that the level is only built once per batch size
+    game = worker_games.get(len(genomes))
+    if game is None:
+        game = worker_games[len(genomes)] = Game(
+            worker_map, 0, len(genomes), headless=True, use_net=True
+        )
+    else:
+        game.reset()
+
+    for player, genome in zip(game.player_sprite_group, genomes):
+        player.jump_controller = JumpControllerAI(
+            net=net_from_genome(genome), use_net=True
+        )
+
+    return [
+        PlayerResult(None, result.score, result.won, result.frames)
+        for result in game.simulate_generation(worker_max_frames)
+    ]
+
+
+class Evaluator:
+    """Plays whole generations of nets through a level in parallel, using a
+    pool of worker processes. Each worker gets the level once and is then
+    handed batches of genomes.
+
+    The players always jump when their nets say so, whatever AI_USE_NET is,
+    since the nets are selected on these scores.
+    """
+
+    def __init__(
+        self,
+        map,
+        max_frames: int = None,
+        max_workers: int = None,
+    ):
+        """Starts the worker processes.
+
+        Args:
+            map (np.ndarray): 2D array where each element is a tile id.
+            max_frames (int, optional): The maximum number of frames to
+                simulate per generation. Defaults to None (no limit).
+            max_workers (int, optional): The number of worker processes.
+                Defaults to the number of CPUs.
+        """
+        self.num_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            self.num_workers,
+            initializer=init_worker,
+            initargs=(np.array(map), max_frames),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def evaluate(self, nets: list[Net]):
+        """Plays every net through the level.
+
+        Args:
+            nets (list[Net]): The nets to evaluate.
+
+        Returns:
+            list[PlayerResult]: One result per net, in the same order. The
+                results do not include the players, which stay in the workers.
+        """
+        genomes = np.stack([get_genome(net) for net in nets])
+        batch_size = max(1, math.ceil(len(genomes) / self.num_workers))
+        batches = [
+            genomes[i : i + batch_size] for i in range(0, len(genomes), batch_size)
+        ]
+
+        results = []
+        for batch_results in self.executor.map(evaluate_batch, batches):
+            results.extend(batch_results)
+        return results
+
+    def close(self):
+        self.executor.shutdown()
@@ -1,23 +1,33 @@
-import random
+import math
+import operator
 
+import numpy as np
 import pygame
 from pygame.math import Vector2
 
+from assets import get_element_asset
+from chunks import ChunkCache
 from components.progress_bar import ProgressBar
 from components.text import Text
 from config import (
+    AI_USE_NET,
+    BATCH_PHYSICS_MIN_PLAYERS,
     BLOCK_SIZE,
-    ELEMENTS,
-    PALETTE,
     SCREEN_BLOCKS,
     SCREEN_SIZE,
     VELOCITY_X,
-    CollisionType,
 )
-from jump_controller import JumpControllerManual, JumpControllerAI
+from jump_controller import (
+    JumpControllerManual,
+    JumpControllerAI,
+    PopulationPolicy,
+)
+from level import Level
+from physics_batch import BatchState, step_batch
+from profiler import FrameProfiler
 from sprites.basic import ElementSprite, ImageSprite, TiledSprite
 from sprites.player import Player
-from utils import FillType, load_image
+from utils import FillType, load_image, random_color
 
 
 class Camera:
@@ -25,6 +35,16 @@ class Camera:
         self.x, self.y = x, y
 
 
+class PlayerResult:
+    """The outcome of one player in a simulated generation."""
+
+    def __init__(self, player: Player, score: int, won: bool, frames: int):
+        self.player = player
+        self.score = score  # x position when the player died or stopped
+        self.won = won
+        self.frames = frames  # number of frames the player was alive
+
+
 class Game:
     """
     A class that represents a game of Geometry Dash.
@@ -36,11 +56,15 @@ class Game:
         num_manual_players=0,
         num_ai_players=0,
         best_ai_player=None,
+        headless=False,
+        nets=None,
+        seed=None,
+        use_net=AI_USE_NET,
     ):
         """Creates a new game.
 
         Args:
-            map (2D list): 2D list where each element is a tile id.
+            map (np.ndarray): 2D array where each element is a tile id.
             num_manual_players (int, optional): The number of manual players.
                 Defaults to 1.
             num_ai_players (int, optional): The number of AI players. Defaults
@@ -48,32 +72,65 @@ class Game:
             best_ai_player (Player, optional): The best AI player from the
                 previous round to model this round's AI players off of. Defaults
                 to None.
+            headless (bool, optional): Whether to run without rendering. A
+                headless game skips the background, floor, progress bar, skin
+                colouring and particles, and is meant to be stepped with
+                simulate_generation() instead of drawn. Defaults to False.
+            nets (list[Net], optional): The nets of the AI players, e.g. from a
+                Population. If given, the AI players use these instead of
+                being modelled off of best_ai_player. Defaults to None.
+            seed (int, optional): The seed for all the random numbers of the
+                game. Two games with the same seed and the same inputs play out
+                the same. Defaults to None (a different game each time).
+            use_net (bool, optional): Whether the new AI players jump when
+                their nets say so instead of following the hand-written rules.
+                Defaults to AI_USE_NET.
         """
         self.map_height = len(map) * BLOCK_SIZE
         self.map_width = len(map[0]) * BLOCK_SIZE
 
         self.num_ai_players = num_ai_players
         self.best_ai_player = best_ai_player
+        self.headless = headless
+        self.use_net = use_net
+
+        # The AI's random numbers are kept apart from the ones that only
+        # change how things look (skins and particles), so that drawing a game
+        # does not change what the AI does.
+        self.rng, self.render_rng = [
+            np.random.default_rng(seed_sequence)
+            for seed_sequence in np.random.SeedSequence(seed).spawn(2)
+        ]
 
         # The camera will determine the upper-left corner of the screen
         self.camera = Camera(0, self.map_height + (4 - SCREEN_BLOCKS[1]) * BLOCK_SIZE)
 
         # sprite group for all the players
         self.player_sprite_group = self.init_players(
-            num_manual_players, num_ai_players, best_ai_player
+            num_manual_players, num_ai_players, best_ai_player, nets
         )
+        self.count_players()
+        self.ai_policy = None
+        # The players' states as a BatchState, for update_players_batch()
+        self.batch, self.batch_states = None, None
+
+        # Times the phases of update(). It is off unless the game is shown
+        # with the performance overlay.
+        self.profiler = FrameProfiler()
 
         # sprite group for all the elements in the map
         self.element_sprite_group = self.init_elements(map)
 
-        # dict from tile coord to sprite element
-        self.element_map = {}
-        for element_sprite in self.element_sprite_group:
-            tile_coord = (
-                element_sprite.rect.x // BLOCK_SIZE,
-                element_sprite.rect.y // BLOCK_SIZE,
-            )
-            self.element_map[tile_coord] = element_sprite
+        # collision geometry of the elements for the physics
+        self.level = Level(map)
+
+        if headless:
+            return
+
+        # the elements pre-rendered into a few large surfaces
+        self.element_chunks = ChunkCache(
+            self.element_sprite_group.sprites(), self.get_elements
+        )
 
         # sprite group for all the background tiles
         self.tile_sprite_group = self.init_tiles()
@@ -85,35 +142,40 @@ class Game:
 
         self.progress_bar = ProgressBar(SCREEN_SIZE[0] / 4, 30, SCREEN_SIZE[0] / 2, 20)
 
-    def init_players(self, num_manual_players, num_ai_players, best_ai_player):
-        # How much space the line of AI players should take up
-        AI_PLAYERS_SPREAD = SCREEN_SIZE[0] / 3
+    def init_players(self, num_manual_players, num_ai_players, best_ai_player, nets):
+        # How much space the line of AI players should take up. Headless
+        # players all start together so that a player's score does not depend
+        # on how many players it is simulated with.
+        AI_PLAYERS_SPREAD = 0 if self.headless else SCREEN_SIZE[0] / 3
+
+        # Headless players are never drawn, so they all share one uncoloured
+        # skin.
+        if self.headless:
+            headless_image = load_image("assets/players/player-0.png")
+            headless_ship_image = load_image("assets/ships/ship-1.png")
 
         player_sprite_group = pygame.sprite.Group()
         for i in range(num_ai_players):
-            color1, color2 = random.choice(PALETTE), random.choice(PALETTE)
-            if i == num_ai_players - 1:
-                # Make the first player the same as the best player from the
-                # previous generation so that the NN does not devolve
-                if best_ai_player:
-                    jump_controller = best_ai_player.jump_controller
-                # If there is no best player, make a random player
-                else:
-                    jump_controller = JumpControllerAI()
-                # The first player gets the player-0 skin
-                image = load_image(f"assets/players/player-0.png")
+            color1 = random_color(self.render_rng)
+            color2 = random_color(self.render_rng)
+            jump_controller = self.new_ai_jump_controller(i, best_ai_player, nets)
+
+            if self.headless:
+                image, ship_image = headless_image, headless_ship_image
             else:
-                # Make the rest of the players a child of the best player
-                if best_ai_player:
-                    jump_controller = JumpControllerAI(
-                        best_ai_player.jump_controller.net
-                    )
-                # If there is no best player, make a random player
+                if i == num_ai_players - 1:
+                    # The first player gets the player-0 skin
+                    image = load_image(f"assets/players/player-0.png")
                 else:
-                    jump_controller = JumpControllerAI()
-                image = load_image(
-                    f"assets/players/player-{random.randint(1, 20)}.png",
-                    fill_type=FillType.PLAYER,
+                    image = load_image(
+                        f"assets/players/player-{self.render_rng.integers(1, 21)}.png",
+                        fill_type=FillType.PLAYER,
+                        color1=color1,
+                        color2=color2,
+                    )
+                ship_image = load_image(
+                    f"assets/ships/ship-1.png",
+                    fill_type=FillType.SHIP,
                     color1=color1,
                     color2=color2,
                 )
@@ -126,59 +188,144 @@ class Game:
                 ),
                 Vector2(VELOCITY_X, 0),
                 image,
-                load_image(
-                    f"assets/ships/ship-1.png",
-                    fill_type=FillType.SHIP,
-                    color1=color1,
-                    color2=color2,
-                ),
+                ship_image,
                 jump_controller=jump_controller,
+                render_particles=not self.headless,
                 sprite_groups=[player_sprite_group],
+                rng=self.render_rng,
             )
         for _ in range(num_manual_players):
             Player(
                 (BLOCK_SIZE * -5, self.map_height - BLOCK_SIZE),
                 Vector2(VELOCITY_X, 0),
                 load_image("assets/players/player-0.png"),
-                load_image(f"assets/ships/ship-1.png", fill_type=FillType.SHIP),
+                load_image(
+                    f"assets/ships/ship-1.png",
+                    fill_type=FillType.SHIP,
+                    rng=self.render_rng,
+                ),
                 jump_controller=JumpControllerManual(),
                 sprite_groups=[player_sprite_group],
+                rng=self.render_rng,
             )
         return player_sprite_group
 
+    def new_ai_jump_controller(self, i, best_ai_player, nets=None):
+        if nets:
+            return JumpControllerAI(net=nets[i], use_net=self.use_net)
+        if i == self.num_ai_players - 1:
+            # Make the first player the same as the best player from the
+            # previous generation so that the NN does not devolve
+            if best_ai_player:
+                return best_ai_player.jump_controller
+            # If there is no best player, make a random player
+            return JumpControllerAI(rng=self.rng, use_net=self.use_net)
+        # Make the rest of the players a child of the best player
+        if best_ai_player:
+            return JumpControllerAI(
+                best_ai_player.jump_controller.net, rng=self.rng, use_net=self.use_net
+            )
+        # If there is no best player, make a random player
+        return JumpControllerAI(rng=self.rng, use_net=self.use_net)
+
+    def reset(self, best_ai_player=None, nets=None):
+        """Restarts the game on the same level. The level, the sprites and
+        the players' skins are kept, and only the camera, the scrolling tiles
+        and the players start over. This is much faster than creating a new
+        Game.
+
+        Args:
+            best_ai_player (Player, optional): The best AI player from the
+                previous round to model this round's AI players off of. It
+                should not be one of this game's players, since those are
+                reset. Defaults to None.
+            nets (list[Net], optional): The nets of the AI players. See
+                __init__(). Defaults to None.
+        """
+        self.best_ai_player = best_ai_player
+        self.ai_policy = None
+        self.camera = Camera(0, self.map_height + (4 - SCREEN_BLOCKS[1]) * BLOCK_SIZE)
+
+        # The AI players come first in the sprite group
+        for i, player in enumerate(self.player_sprite_group):
+            player.reset()
+            if i < self.num_ai_players:
+                player.jump_controller = self.new_ai_jump_controller(
+                    i, best_ai_player, nets
+                )
+        self.count_players()
+
+        if self.headless:
+            return
+
+        for tile in self.tile_sprite_group:
+            tile.reset()
+        self.progress_bar.progress = 0
+
     def init_elements(self, map):
+        """Creates the sprites of the elements. They are also bucketed by the
+        tile column they are in, so that draw() only has to visit the columns
+        on the screen.
+
+        Args:
+            map (np.ndarray): 2D array where each element is a tile id.
+
+        Returns:
+            pygame.sprite.Group: The sprites of all the elements.
+        """
         element_sprite_group = pygame.sprite.Group()
-        x, y = 0, 0
-        for row in map:
-            for id in row:
-                is_portal = ELEMENTS[id]["collision_type"] in [
-                    CollisionType.PORTAL_FLY_START,
-                    CollisionType.PORTAL_FLY_END,
-                    CollisionType.PORTAL_GRAVITY_REVERSE,
-                    CollisionType.PORTAL_GRAVITY_NORMAL,
-                ]
-                image = load_image(
-                    ELEMENTS[id]["filename"],
-                    (
-                        BLOCK_SIZE * (3 if is_portal else 1),
-                        BLOCK_SIZE * (3 if is_portal else 1),
-                    ),
+        # list of the element sprites in each tile column
+        self.element_columns = [[] for _ in range(len(map[0]))]
+        # How many columns an element's image can reach past its own column to
+        # the left and to the right (e.g. portals are drawn from 2 tiles to the
+        # left of their cell)
+        self.element_reach_left, self.element_reach_right = 0, 0
+
+        # Only visit the non-empty tiles
+        for ty, tx in zip(*np.nonzero(map)):
+            asset = get_element_asset(str(map[ty, tx]))
+            if asset.image:
+                x, y = int(tx) * BLOCK_SIZE, int(ty) * BLOCK_SIZE
+                element = ElementSprite(
+                    (x - asset.offset, y - asset.offset),
+                    asset,
+                    element_sprite_group,
+                )
+                self.element_columns[tx].append(element)
+                self.element_reach_left = max(
+                    self.element_reach_left,
+                    math.ceil((x - element.rect.left) / BLOCK_SIZE),
+                )
+                self.element_reach_right = max(
+                    self.element_reach_right,
+                    math.ceil((element.rect.right - x - BLOCK_SIZE) / BLOCK_SIZE),
                 )
-                if image:
-                    ElementSprite(
-                        (
-                            x - BLOCK_SIZE * (2 if is_portal else 0),
-                            y - BLOCK_SIZE * (2 if is_portal else 0),
-                        ),
-                        image,
-                        ELEMENTS[id]["collision_type"],
-                        element_sprite_group,
-                    )
-                x += BLOCK_SIZE
-            x = 0
-            y += BLOCK_SIZE
         return element_sprite_group
 
+    def get_elements(self, left: int, right: int):
+        """Returns the elements that can be drawn between two x positions,
+        going through only the tile columns in between.
+
+        Args:
+            left (int): The x position to start at.
+            right (int): The x position to end at (exclusive).
+
+        Returns:
+            list[ElementSprite]: The elements, column by column.
+        """
+        first_column = max(
+            0, math.floor(left / BLOCK_SIZE) - self.element_reach_right
+        )
+        last_column = min(
+            len(self.element_columns) - 1,
+            math.floor((right - 1) / BLOCK_SIZE) + self.element_reach_left,
+        )
+        return [
+            element
+            for column in self.element_columns[first_column : last_column + 1]
+            for element in column
+        ]
+
     def init_tiles(self):
         tile_sprite_group = pygame.sprite.Group()
         # Background tiles
@@ -201,16 +348,31 @@ class Game:
             )
         return tile_sprite_group
 
+    def get_ai_policy(self):
+        """Returns the policy that decides the jumps of all the AI players with
+        their nets. It is built the first time it is needed after the game is
+        created or reset, so jump controllers can still be swapped until then.
+
+        Returns:
+            PopulationPolicy: The policy of the AI players.
+        """
+        if self.ai_policy is None:
+            ai_players = self.player_sprite_group.sprites()[: self.num_ai_players]
+            self.ai_policy = PopulationPolicy(
+                [player.jump_controller for player in ai_players]
+            )
+        return self.ai_policy
+
     def update(self):
-        for player in self.player_sprite_group:
-            if not player.dead:
-                # print("on_ground", player.on_ground)
-                player.should_jump = player.jump_controller.should_jump(
-                    player, self.element_map, self.map_height
-                )
-            player.update(self.element_map, self.map_height)
+        with self.profiler.phase("should_jump"):
+            self.update_should_jump()
+        with self.profiler.phase("player_update"):
+            self.update_players()
 
-        player_x = self.player_sprite_group.sprites()[-1].rect.x
+        if self.headless:
+            return
+
+        player_x = self.player_sprite_group.sprites()[-1].state.x
 
         # Starting animation: don't move the camera until the player is past the
         # first third of the screen
@@ -228,18 +390,106 @@ class Game:
                 self.camera.x + SCREEN_SIZE[0] / 3 + BLOCK_SIZE * 2
             ) / self.map_width
 
-    def all_dead(self):
+    def update_should_jump(self):
+        """Asks the jump controllers of the players that are still running
+        whether to jump this frame.
+        """
+        # The AI players' nets are run for all of them at once
+        net_indices, net_players = [], []
+        for i, player in enumerate(self.player_sprite_group):
+            if player.dead or player.won:
+                continue
+            if i < self.num_ai_players and player.jump_controller.use_net:
+                net_indices.append(i)
+                net_players.append(player)
+            else:
+                player.should_jump = player.jump_controller.should_jump(
+                    player.state, self.level
+                )
+        if net_players:
+            jumps = self.get_ai_policy().should_jump(
+                net_indices, [player.state for player in net_players], self.level
+            )
+            for player, jump in zip(net_players, jumps):
+                player.should_jump = bool(jump)
+
+    def update_players(self):
+        """Moves the players one frame and keeps the counts up to date as
+        players die, win or run past the end of the level.
+        """
+        if self.headless and self.num_alive >= BATCH_PHYSICS_MIN_PLAYERS:
+            self.update_players_batch()
+            return
+
+        self.batch = None  # the states are stepped without it from here on
         for player in self.player_sprite_group:
-            if not player.dead:
-                return False
-        return True
+            was_alive = not player.dead
+            was_running = self.is_running(player)
+            player.update(self.level)
+            if was_alive and player.dead:
+                self.num_alive -= 1
+            if was_running and not self.is_running(player):
+                self.num_running -= 1
+
+    def update_players_batch(self):
+        """Moves the players one frame with physics_batch.step_batch() instead
+        of one by one. This gives the same results as update_players(), and is
+        only used for headless games since their players have no particles.
+
+        The batch is kept between frames and only the attributes that changed
+        are copied back into the players' states. It is built again whenever a
+        player's state is replaced, e.g. by reset() or Player.restore().
+        """
+        players = self.player_sprite_group.sprites()
+        states = [player.state for player in players]
+        if self.batch is None or not all(map(operator.is_, states, self.batch_states)):
+            self.batch, self.batch_states = BatchState(states), states
+        batch = self.batch
+
+        active = ~(batch.dead | batch.won)
+        previous = batch.copy()
+        jumps = np.array([player.should_jump for player in players], bool)
+        step_batch(batch, jumps, self.level)
+        batch.write_back(states, previous)
+
+        for i in np.flatnonzero(active).tolist():
+            players[i].update_image()
+            players[i].should_jump = False
+        self.num_alive = int(np.count_nonzero(~batch.dead))
+        self.num_running = int(
+            np.count_nonzero(~(batch.dead | batch.won) & (batch.x < self.map_width))
+        )
 
-    def count_alive(self):
-        count = 0
+    def is_running(self, player: Player):
+        """Returns whether a player is still running, i.e. it is alive, has not
+        won and is not past the end of the level. Some levels have no end
+        element, so players that survive them run on forever.
+
+        Args:
+            player (Player): The player.
+
+        Returns:
+            bool: Whether the player is running.
+        """
+        return not (player.dead or player.won or player.state.x >= self.map_width)
+
+    def count_players(self):
+        """Counts the players that are alive and that are still running (see
+        is_running()). update() keeps these counts up to date from then on.
+        """
+        self.num_alive = 0
+        self.num_running = 0
         for player in self.player_sprite_group:
             if not player.dead:
-                count += 1
-        return count
+                self.num_alive += 1
+            if self.is_running(player):
+                self.num_running += 1
+
+    def all_dead(self):
+        return self.num_alive == 0
+
+    def count_alive(self):
+        return self.num_alive
 
     def get_winner(self):
         for player in self.player_sprite_group:
@@ -247,6 +497,52 @@ class Game:
                 return player
         return None
 
+    def simulate_generation(self, max_frames: int = None):
+        """Steps the game as fast as possible until every player has died, won
+        or run past the end of the level, or max_frames have been simulated.
+        This does no drawing and no frame limiting, so it is meant to be used
+        with a headless game.
+
+        Args:
+            max_frames (int, optional): The maximum number of frames to
+                simulate. Players that are still running when the generation
+                is cut off are scored by their current position, so a score
+                depends on max_frames when it is too small to reach the end of
+                the level. Defaults to None (no limit).
+
+        Returns:
+            list[PlayerResult]: One result per player, in sprite group order.
+        """
+        num_frames = 0
+        while not self.all_finished():
+            if max_frames is not None and num_frames >= max_frames:
+                break
+            self.update()
+            num_frames += 1
+
+        return [
+            PlayerResult(
+                player, self.get_score(player), player.won, player.frames_alive
+            )
+            for player in self.player_sprite_group
+        ]
+
+    def get_score(self, player: Player):
+        """Returns how far a player got: where it died, or where it is if it
+        is still alive (e.g. it won, ran past the end of the level or was cut
+        off).
+
+        Args:
+            player (Player): The player, which may be a clone.
+
+        Returns:
+            int: The score.
+        """
+        return player.score if player.dead else player.state.x
+
+    def all_finished(self):
+        return self.num_running == 0
+
     def draw(
         self,
         screen: pygame.Surface,
@@ -255,13 +551,17 @@ class Game:
         total_time: float,
         simulate: bool,
     ):
+        """Draws the level, the players and the HUD.
+
+        Returns:
+            list[pygame.Rect]: The rects of the timers. Everything else only
+                changes when the game is updated or the camera moves.
+        """
         self.tile_sprite_group.draw(screen)
 
         screen.blit(self.floor.image, self.floor.rect.move(0, -self.camera.y))
 
-        for element in self.element_sprite_group:
-            offset_rect = element.rect.move(-self.camera.x, -self.camera.y)
-            screen.blit(element.image, offset_rect)
+        self.element_chunks.draw(screen, self.camera)
 
         # player particles
         alpha_surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
@@ -277,17 +577,19 @@ class Game:
 
         for player in self.player_sprite_group:
             screen.blit(
-                player.ship_image if player.flying else player.image,
+                player.image,
                 player.rect.move(-self.camera.x, -self.camera.y),
             )
 
         self.progress_bar.draw(screen)
 
-        Text(
-            f"Time: {game_time:.2f}s",
-            30,
-            bottomleft=(20, SCREEN_SIZE[1] - 20),
-        ).draw(screen)
+        timer_rects = [
+            Text(
+                f"Time: {game_time:.2f}s",
+                30,
+                bottomleft=(20, SCREEN_SIZE[1] - 20),
+            ).draw(screen)
+        ]
 
         if not simulate:
             Text(
@@ -305,10 +607,16 @@ class Game:
                 30,
                 topleft=(20, 50),
             ).draw(screen)
-            best_score = self.best_ai_player.score if self.best_ai_player else 0
+            best_score = (
+                self.get_score(self.best_ai_player) if self.best_ai_player else 0
+            )
             Text(
                 f"Best score: {(100 * best_score / self.map_width):.2f}%",
                 30,
                 topleft=(20, 80),
             ).draw(screen)
-            Text(f"Total time: {total_time:.2f}s", 30, topleft=(20, 110)).draw(screen)
+            total_time_text = Text(
+                f"Total time: {total_time:.2f}s", 30, topleft=(20, 110)
+            )
+            timer_rects.append(total_time_text.draw(screen))
+        return timer_rects
@@ -0,0 +1,101 @@
+import numpy as np
+
+from assets import get_element_asset
+from config import BLOCK_SIZE, ELEMENTS, CollisionType
+
+
+# Tables indexed by integer element id, filled in by init_element_tables().
+# COLLISION_TYPES holds each element's CollisionType (None if it has no image),
+# MASKS the mask of its image and SIZES the (width, height) of its image.
+NUM_ELEMENT_IDS = max(int(id) for id in ELEMENTS) + 1
+COLLISION_TYPES = []
+MASKS = []
+SIZES = []
+
+
+def init_element_tables():
+    for i in range(NUM_ELEMENT_IDS):
+        asset = get_element_asset(str(i)) if str(i) in ELEMENTS else None
+        if asset and asset.image:
+            COLLISION_TYPES.append(asset.collision_type)
+            MASKS.append(asset.mask)
+            SIZES.append(asset.image.get_size())
+        else:
+            COLLISION_TYPES.append(None)
+            MASKS.append(None)
+            SIZES.append(None)
+
+
+class Level:
+    """The collision geometry of a map. This is all the physics needs to know
+    about a level, so it holds plain numbers instead of sprites.
+
+    Elements are stored in a dense grid of element ids. Each element is stored
+    at the tile of the top-left corner of its image, so portals (which are
+    drawn from 2 tiles above and to the left of their cell) are moved there.
+    When two elements end up on the same tile, the one later in the map wins.
+    """
+
+    def __init__(self, map: np.ndarray):
+        """Creates a new level.
+
+        Args:
+            map (np.ndarray): 2D array where each element is a tile id.
+        """
+        if not COLLISION_TYPES:
+            init_element_tables()
+
+        self.num_rows = len(map)
+        self.num_cols = len(map[0])
+        self.width = self.num_cols * BLOCK_SIZE
+        self.height = self.num_rows * BLOCK_SIZE
+        self.floor_level = self.height  # The y coordinate of the floor
+
+        map_ids = np.asarray(map, np.uint8)
+        self.id_grid = np.zeros((self.num_rows, self.num_cols), np.uint8)
+        for ty, tx in zip(*np.nonzero(map_ids)):
+            id = map_ids[ty, tx]
+            if COLLISION_TYPES[id] is None:
+                continue
+            offset = get_element_asset(str(id)).offset // BLOCK_SIZE
+            if tx >= offset and ty >= offset:
+                self.id_grid[ty - offset, tx - offset] = id
+
+        # Row-major copy of id_grid for fast scalar lookups
+        self.ids = self.id_grid.tobytes()
+
+    def get(self, tx: int, ty: int):
+        """Returns the element at the given tile coordinate.
+
+        Args:
+            tx (int): The tile column.
+            ty (int): The tile row.
+
+        Returns:
+            tuple: (collision_type, mask, left, top, right, bottom) with the
+                rect of the element's image in pixels, or None if there is no
+                element that can be collided with.
+        """
+        if not (0 <= tx < self.num_cols and 0 <= ty < self.num_rows):
+            return None
+        id = self.ids[ty * self.num_cols + tx]
+        collision_type = COLLISION_TYPES[id]
+        if collision_type is None or collision_type == CollisionType.NONE:
+            return None
+        width, height = SIZES[id]
+        x, y = tx * BLOCK_SIZE, ty * BLOCK_SIZE
+        return (collision_type, MASKS[id], x, y, x + width, y + height)
+
+    def get_collision_type(self, tx: int, ty: int):
+        """Returns the collision type at the given tile coordinate.
+
+        Args:
+            tx (int): The tile column.
+            ty (int): The tile row.
+
+        Returns:
+            CollisionType: The collision type, or None if there is no element.
+        """
+        if not (0 <= tx < self.num_cols and 0 <= ty < self.num_rows):
+            return None
+        return COLLISION_TYPES[self.ids[ty * self.num_cols + tx]]
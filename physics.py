@@ -0,0 +1,384 @@
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING
+
+import pygame
+
+from config import (
+    BLOCK_SIZE,
+    GRAVITY,
+    VELOCITY_MAX_FALL,
+    VELOCITY_JUMP,
+    VELOCITY_JUMP_PAD,
+    VELOCITY_JUMP_ORB,
+    CollisionType,
+)
+
+if TYPE_CHECKING:
+    from level import Level
+
+
+# Neighbouring tiles to check for collisions, relative to the player's center
+# tile. (1, -2) is to check for portals since they have a height of 3.
+NEIGHBORS_X = [(1, -2)] + [(x, y) for x in range(-1, 2) for y in range(-1, 2)]
+NEIGHBORS_Y = [(x, y) for x in range(-1, 2) for y in range(-1, 2)]
+
+SOLID_TYPES = (
+    CollisionType.SOLID,
+    CollisionType.SOLID_TOP,
+    CollisionType.SOLID_BOTTOM,
+)
+PORTAL_TYPES = (
+    CollisionType.PORTAL_FLY_START,
+    CollisionType.PORTAL_FLY_END,
+    CollisionType.PORTAL_GRAVITY_REVERSE,
+    CollisionType.PORTAL_GRAVITY_NORMAL,
+)
+
+
+# The number of rotations to keep per skin. A cube only turns in steps of 3.6
+# degrees, but the ship tilts with its velocity, so a long level reaches a few
+# hundred angles.
+MAX_ROTATIONS = 512
+
+
+class Skin:
+    """The images of a player (the cube, and the ship with the cube inside it)
+    and their rotations. The player collides with the mask of its rotated
+    image, so each rotation and its mask are only computed once and then shared
+    by the players with this skin, their snapshots and the AI's lookahead.
+    """
+
+    def __init__(self, image: pygame.Surface, ship_image: pygame.Surface):
+        """Creates a skin.
+
+        Args:
+            image (pygame.Surface): The player image.
+            ship_image (pygame.Surface): The ship image with the player in it.
+        """
+        self.image = image
+        self.ship_image = ship_image
+        # dict from (angle, flying) to (rotated image, mask), from oldest to
+        # newest
+        self.rotations = {}
+
+    def get_rotation(self, angle: float, flying: bool):
+        """Returns the player or ship image rotated by the given angle, and its
+        mask.
+
+        Args:
+            angle (float): The angle in degrees.
+            flying (bool): Whether to rotate the ship image.
+
+        Returns:
+            tuple: (pygame.Surface, pygame.mask.Mask) the rotated image and its
+                mask.
+        """
+        # The angles only differ by floating point errors when they round to
+        # the same hundredth of a degree
+        key = (round(angle % 360, 2), flying)
+        rotation = self.rotations.get(key)
+        if rotation is None:
+            image = pygame.transform.rotate(
+                self.ship_image if flying else self.image, angle
+            )
+            rotation = self.rotations[key] = (image, pygame.mask.from_surface(image))
+            if len(self.rotations) > MAX_ROTATIONS:
+                del self.rotations[next(iter(self.rotations))]
+        return rotation
+
+
+class PlayerState:
+    """The physical state of a player. This is everything step() needs, so it
+    can be copied and simulated without a sprite. The rotated image and mask
+    come from the player's Skin and are shared, not copied.
+    """
+
+    __slots__ = (
+        "x",
+        "y",
+        "velocity_x",
+        "velocity_y",
+        "angle",
+        "gravity_reversed",
+        "flying",
+        "on_ground",
+        "on_ceiling",
+        "dead",
+        "won",
+        "score",
+        "frames_alive",
+        "skin",
+        "image",
+        "mask",
+    )
+
+    def __init__(
+        self,
+        x: int,
+        y: int,
+        velocity_x: int,
+        skin: Skin,
+        velocity_y: float = 0,
+        angle: float = 0,
+        gravity_reversed: bool = False,
+        flying: bool = False,
+        on_ground: bool = False,
+        on_ceiling: bool = False,
+    ):
+        self.x = x  # left of the rotated image
+        self.y = y  # top of the rotated image
+        self.velocity_x = velocity_x
+        self.velocity_y = velocity_y
+        self.angle = angle
+
+        self.gravity_reversed = gravity_reversed
+        self.flying = flying
+        self.on_ground = on_ground
+        self.on_ceiling = on_ceiling  # TODO: do something with this (e.g. when flying)
+
+        self.dead = False
+        self.won = False
+        self.score = 0  # x position when the player died
+        self.frames_alive = 0
+
+        # A new player starts with the unrotated player image, even if it is
+        # flying or at an angle
+        self.skin = skin
+        self.image, self.mask = skin.get_rotation(0, False)
+
+    def __eq__(self, other: PlayerState):
+        return all(
+            getattr(self, attr) == getattr(other, attr)
+            for attr in PlayerState.__slots__
+        )
+
+    def copy(self):
+        """Returns a new state with the same attributes.
+
+        Returns:
+            PlayerState: The copied state.
+        """
+        state = PlayerState.__new__(PlayerState)
+        for attr in PlayerState.__slots__:
+            setattr(state, attr, getattr(self, attr))
+        return state
+
+    def respawned(self):
+        """Returns a copy that is alive and has the unrotated player image at
+        the same top-left, like a new player created at this position.
+
+        Returns:
+            PlayerState: The copied state.
+        """
+        state = self.copy()
+        state.dead = False
+        state.won = False
+        state.image, state.mask = self.skin.get_rotation(0, False)
+        return state
+
+
+def apply_gravity(state: PlayerState, gravity: float):
+    if not state.gravity_reversed:
+        state.velocity_y = min(state.velocity_y + gravity, VELOCITY_MAX_FALL)
+    else:
+        state.velocity_y = max(state.velocity_y - gravity, -VELOCITY_MAX_FALL)
+
+
+def kill(state: PlayerState):
+    state.dead = True
+    state.score = state.x
+    state.velocity_x, state.velocity_y = 0, 0
+
+
+def set_portal(state: PlayerState, collision_type: CollisionType):
+    match collision_type:
+        case CollisionType.PORTAL_FLY_START:
+            state.flying = True
+        case CollisionType.PORTAL_FLY_END:
+            state.flying = False
+        case CollisionType.PORTAL_GRAVITY_REVERSE:
+            state.gravity_reversed = True
+        case CollisionType.PORTAL_GRAVITY_NORMAL:
+            state.gravity_reversed = False
+
+
+def check_collisions_x(state: PlayerState, level: Level):
+    """Checks for collisions in the x direction.
+
+    Args:
+        state (PlayerState): The player to check.
+        level (Level): The level to check against.
+    """
+    left, top = state.x, state.y
+    width, height = state.mask.get_size()
+    right, bottom = left + width, top + height
+    center_x = (left + width // 2) // BLOCK_SIZE
+    center_y = (top + height // 2) // BLOCK_SIZE
+
+    for x, y in NEIGHBORS_X:
+        element = level.get(center_x + x, center_y + y)
+        if not element:
+            continue
+
+        collision_type, mask, e_left, e_top, e_right, e_bottom = element
+        if state.mask.overlap(mask, (e_left - left, e_top - top)):
+            match collision_type:
+                case type if type in SOLID_TYPES or type == CollisionType.SPIKE:
+                    kill(state)
+                    return
+                case CollisionType.JUMP_PAD:
+                    # wait until the player is in the middle of the jump pad
+                    if left >= e_left - 6:
+                        state.velocity_y = -VELOCITY_JUMP_PAD
+                case CollisionType.END:
+                    state.won = True
+                    state.velocity_x, state.velocity_y = 0, 0
+                    return
+                case _:
+                    set_portal(state, collision_type)
+        elif left < e_right and e_left < right and top < e_bottom and e_top < bottom:
+            # Portals also trigger on the transparent parts of their image
+            set_portal(state, collision_type)
+
+
+def check_collisions_y(state: PlayerState, level: Level):
+    """Checks for collisions in the y direction.
+
+    Args:
+        state (PlayerState): The player to check.
+        level (Level): The level to check against.
+    """
+    width, height = state.mask.get_size()
+
+    # If on the floor level, there will be no other y collisions
+    if state.y + height >= level.floor_level:
+        state.y = level.floor_level - height
+        state.velocity_y = 0
+        state.on_ground = True
+        return
+
+    for x, y in NEIGHBORS_Y:
+        # The player may have been moved by a previous element
+        element = level.get(
+            (state.x + width // 2) // BLOCK_SIZE + x,
+            (state.y + height // 2) // BLOCK_SIZE + y,
+        )
+        if not element:
+            continue
+
+        collision_type, mask, e_left, e_top, _, e_bottom = element
+        if not state.mask.overlap(mask, (e_left - state.x, e_top - state.y)):
+            continue
+
+        match collision_type:
+            case type if type in SOLID_TYPES:
+                if not state.gravity_reversed:
+                    if state.velocity_y > 0:  # player is falling
+                        state.y = e_top - height
+                        state.velocity_y = 0
+                        state.on_ground = True
+                    elif state.velocity_y < 0:  # player is jumping
+                        state.y = e_bottom
+                else:
+                    if state.velocity_y < 0:  # player is falling
+                        state.y = e_bottom
+                        state.velocity_y = 0
+                        state.on_ground = True
+                    elif state.velocity_y > 0:  # player is jumping
+                        state.y = e_top - height
+            case CollisionType.SPIKE:
+                kill(state)
+                return
+
+
+def rotate(state: PlayerState):
+    """Rotates the player's image to its angle, keeping the left and the bottom
+    of the image where they are.
+
+    Args:
+        state (PlayerState): The player to rotate.
+    """
+    bottom = state.y + state.mask.get_size()[1]
+    state.image, state.mask = state.skin.get_rotation(state.angle, state.flying)
+    state.y = bottom - state.mask.get_size()[1]
+
+
+def update_angle(state: PlayerState):
+    """Spins the player in the air, tilts the ship with its velocity and rolls
+    the player back to the nearest 90 degrees on the ground.
+
+    Args:
+        state (PlayerState): The player to update.
+    """
+    if state.on_ground:
+        curr_angle = state.angle % 360
+        next_flat_angle = 90 * round(curr_angle / 90)
+        if math.isclose(curr_angle, next_flat_angle):
+            return  # already flat, so the image is not rotated
+        if curr_angle < next_flat_angle:  # Rotate counter-clockwise
+            state.angle = min(curr_angle + 7.2, next_flat_angle)
+        else:  # Rotate clockwise
+            state.angle = max(curr_angle - 7.2, next_flat_angle)
+    elif state.flying:
+        state.angle = max(min(state.velocity_y * -2, 20), -20)
+    else:  # not on the ground and not flying (i.e., spinning in air)
+        state.angle -= 7.2
+    rotate(state)
+
+
+def step(state: PlayerState, jump: bool, level: Level):
+    """Advances the player by one frame.
+
+    Args:
+        state (PlayerState): The player to update in place.
+        jump (bool): Whether the jump button is held this frame.
+        level (Level): The level the player is in.
+    """
+    if state.dead or state.won:
+        return
+
+    state.frames_alive += 1
+
+    # Move x
+    state.x += state.velocity_x
+
+    # Check collisions x
+    check_collisions_x(state, level)
+
+    if state.dead:
+        return
+
+    # Update velocity.y with gravity
+    if not state.flying:
+        apply_gravity(state, GRAVITY)
+    else:
+        apply_gravity(state, GRAVITY / 2)
+
+    # Update velocity.y with jump
+    if jump:
+        tile_type = level.get_collision_type(
+            state.x // BLOCK_SIZE, state.y // BLOCK_SIZE
+        )
+        if tile_type == CollisionType.JUMP_ORB:
+            state.velocity_y = VELOCITY_JUMP_ORB * (1 if state.gravity_reversed else -1)
+        elif not state.flying:
+            if state.on_ground and not state.gravity_reversed:
+                state.velocity_y = -VELOCITY_JUMP
+            elif state.on_ceiling and state.gravity_reversed:
+                state.velocity_y = VELOCITY_JUMP
+        else:
+            if not state.gravity_reversed:
+                state.velocity_y = max(state.velocity_y + -GRAVITY * 5, -GRAVITY * 5)
+            else:
+                state.velocity_y = min(state.velocity_y + GRAVITY * 5, GRAVITY * 5)
+
+    update_angle(state)
+
+    # Move y. We are using round() to avoid floating point errors when
+    # velocity_y = GRAVITY = 0.86 because on_ground would not be True.
+    state.y += round(state.velocity_y)
+    state.on_ground = False
+
+    # Check collisions y
+    check_collisions_y(state, level)
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import numpy as np
+
+from config import (
+    BLOCK_SIZE,
+    GRAVITY,
+    VELOCITY_MAX_FALL,
+    VELOCITY_JUMP,
+    VELOCITY_JUMP_ORB,
+    CollisionType,
+)
+from level import COLLISION_TYPES, SIZES, Level
+from physics import NEIGHBORS_X, NEIGHBORS_Y, PlayerState, step
+
+
+# The attributes of a PlayerState that are stored as arrays, and their types
+ARRAY_ATTRS = {
+    "x": np.int64,
+    "y": np.int64,
+    "velocity_x": np.int64,
+    "velocity_y": np.float64,
+    "angle": np.float64,
+    "gravity_reversed": bool,
+    "flying": bool,
+    "on_ground": bool,
+    "on_ceiling": bool,
+    "dead": bool,
+    "won": bool,
+    "score": np.int64,
+    "frames_alive": np.int64,
+}
+# The attributes that are kept as object arrays, since they are Python objects
+OBJECT_ATTRS = ("skin", "image", "mask")
+
+# Arrays indexed by element id, built by init_element_arrays() from the tables
+# in level.py once a Level has filled them in. COLLIDABLE says whether a player
+# can collide with the element, JUMP_ORB whether it is a jump orb, and WIDTHS
+# and HEIGHTS are the size of its image.
+COLLIDABLE = None
+JUMP_ORB = None
+WIDTHS = None
+HEIGHTS = None
+
+
+def init_element_arrays():
+    global COLLIDABLE, JUMP_ORB, WIDTHS, HEIGHTS
+    COLLIDABLE = np.array(
+        [type is not None and type != CollisionType.NONE for type in COLLISION_TYPES]
+    )
+    JUMP_ORB = np.array([type == CollisionType.JUMP_ORB for type in COLLISION_TYPES])
+    WIDTHS = np.array([size[0] if size else 0 for size in SIZES])
+    HEIGHTS = np.array([size[1] if size else 0 for size in SIZES])
+
+
+class BatchState:
+    """The physical state of a whole population of players as a struct of
+    arrays. Index i of every array belongs to player i. The skins, rotated
+    images and masks are kept in object arrays.
+    """
+
+    def __init__(self, states: list[PlayerState]):
+        """Creates a new batch from individual player states.
+
+        Args:
+            states (list[PlayerState]): The players to batch.
+        """
+        for attr, dtype in ARRAY_ATTRS.items():
+            setattr(
+                self,
+                attr,
+                np.array([getattr(state, attr) for state in states], dtype),
+            )
+        for attr in OBJECT_ATTRS:
+            values = np.empty(len(states), object)
+            values[:] = [getattr(state, attr) for state in states]
+            setattr(self, attr, values)
+
+        sizes = np.array([mask.get_size() for mask in self.mask], np.int64)
+        self.width, self.height = sizes.reshape(-1, 2).T.copy()
+
+        # The index of each player's skin among the different skins, so that
+        # players can be grouped by skin
+        skin_ids = {}
+        self.skin_id = np.array(
+            [skin_ids.setdefault(id(skin), len(skin_ids)) for skin in self.skin],
+            np.int64,
+        )
+
+    def __len__(self):
+        return len(self.x)
+
+    def copy(self):
+        """Returns a new batch with copies of the arrays.
+
+        Returns:
+            BatchState: The copied batch. The skins, images and masks are
+                shared.
+        """
+        batch = BatchState.__new__(BatchState)
+        for attr in [*ARRAY_ATTRS, *OBJECT_ATTRS, "width", "height", "skin_id"]:
+            setattr(batch, attr, getattr(self, attr).copy())
+        return batch
+
+    def get(self, i: int):
+        """Returns player i as a PlayerState.
+
+        Args:
+            i (int): The index of the player.
+
+        Returns:
+            PlayerState: A copy of the player's state.
+        """
+        state = PlayerState.__new__(PlayerState)
+        for attr in ARRAY_ATTRS:
+            setattr(state, attr, getattr(self, attr)[i].item())
+        for attr in OBJECT_ATTRS:
+            setattr(state, attr, getattr(self, attr)[i])
+        return state
+
+    def set(self, i: int, state: PlayerState):
+        """Sets player i to a PlayerState.
+
+        Args:
+            i (int): The index of the player.
+            state (PlayerState): The state to copy.
+        """
+        for attr in [*ARRAY_ATTRS, *OBJECT_ATTRS]:
+            getattr(self, attr)[i] = getattr(state, attr)
+        self.width[i], self.height[i] = state.mask.get_size()
+
+    def write_back(self, states: list[PlayerState], previous: BatchState = None):
+        """Copies the batch into the player states it was created from.
+
+        Args:
+            states (list[PlayerState]): The players, in the same order as when
+                the batch was created.
+            previous (BatchState, optional): A copy of the batch from when the
+                states were last written to. If given, only the attributes
+                that changed since then are written. Defaults to None.
+        """
+        for attr in [*ARRAY_ATTRS, *OBJECT_ATTRS]:
+            values = getattr(self, attr)
+            if previous is None:
+                indices = range(len(states))
+            else:
+                indices = np.flatnonzero(values != getattr(previous, attr))
+                values = values[indices]
+                indices = indices.tolist()
+            for i, value in zip(indices, values.tolist()):
+                setattr(states[i], attr, value)
+
+
+def lookup(level: Level, tx: np.ndarray, ty: np.ndarray):
+    """Returns the element ids at the given tile coordinates. Tiles outside of
+    the level have an id of 0, which is never collidable.
+
+    Args:
+        level (Level): The level to look in.
+        tx (np.ndarray): The tile columns.
+        ty (np.ndarray): The tile rows.
+
+    Returns:
+        np.ndarray: The element ids.
+    """
+    inside = (tx >= 0) & (tx < level.num_cols) & (ty >= 0) & (ty < level.num_rows)
+    ids = level.id_grid[np.where(inside, ty, 0), np.where(inside, tx, 0)]
+    return np.where(inside, ids, 0)
+
+
+def touches_element(
+    batch: BatchState, level: Level, players: np.ndarray, neighbors: list[tuple]
+):
+    """Returns which players' rects overlap the rect of an element that they
+    would check for collisions. The image of an element is inside its rect, so
+    a player that overlaps no rect cannot collide with anything.
+
+    Args:
+        batch (BatchState): The players.
+        level (Level): The level to check against.
+        players (np.ndarray): Which players to check.
+        neighbors (list[tuple]): The tiles to check, relative to the player's
+            center tile, e.g. physics.NEIGHBORS_X.
+
+    Returns:
+        np.ndarray: Whether each player was checked and overlaps an element.
+    """
+    indices = np.flatnonzero(players)
+    left, top = batch.x[indices], batch.y[indices]
+    width, height = batch.width[indices], batch.height[indices]
+    right, bottom = left + width, top + height
+
+    offsets = np.array(neighbors).T[:, :, None]
+    # The tiles of the neighbors, with one row per neighbor
+    tx = (left + width // 2) // BLOCK_SIZE + offsets[0]
+    ty = (top + height // 2) // BLOCK_SIZE + offsets[1]
+    ids = lookup(level, tx, ty)
+    e_left, e_top = tx * BLOCK_SIZE, ty * BLOCK_SIZE
+
+    touches = np.zeros(len(batch), bool)
+    touches[indices] = (
+        COLLIDABLE[ids]
+        & (left < e_left + WIDTHS[ids])
+        & (e_left < right)
+        & (top < e_top + HEIGHTS[ids])
+        & (e_top < bottom)
+    ).any(axis=0)
+    return touches
+
+
+def update_angle(batch: BatchState, active: np.ndarray):
+    """Updates the angles and images of the players. See physics.update_angle.
+
+    Args:
+        batch (BatchState): The players to update.
+        active (np.ndarray): Which players to update.
+    """
+    curr_angle = batch.angle % 360
+    next_flat_angle = 90 * np.round(curr_angle / 90)
+    # The same as math.isclose() with its default tolerances
+    is_close = np.abs(curr_angle - next_flat_angle) <= 1e-09 * np.maximum(
+        np.abs(curr_angle), np.abs(next_flat_angle)
+    )
+    rolled = np.where(
+        curr_angle < next_flat_angle,
+        np.minimum(curr_angle + 7.2, next_flat_angle),
+        np.maximum(curr_angle - 7.2, next_flat_angle),
+    )
+    tilted = np.maximum(np.minimum(batch.velocity_y * -2, 20), -20)
+
+    rolling = active & batch.on_ground & ~is_close
+    flying = active & ~batch.on_ground & batch.flying
+    spinning = active & ~batch.on_ground & ~batch.flying
+
+    batch.angle = np.where(rolling, rolled, batch.angle)
+    batch.angle = np.where(flying, tilted, batch.angle)
+    batch.angle = np.where(spinning, batch.angle - 7.2, batch.angle)
+
+    # Rotate the images, keeping their bottoms where they are. Players with the
+    # same skin are often at the same angle, so each rotation is only looked up
+    # once.
+    rotated = np.flatnonzero(rolling | flying | spinning)
+    if rotated.size:
+        keys = (
+            batch.skin_id[rotated],
+            batch.flying[rotated],
+            batch.angle[rotated],
+        )
+        order = np.lexsort(keys)
+        # Whether each player in sorted order has a different key than the last
+        new_key = np.ones(len(order), bool)
+        for key in keys:
+            new_key[1:] |= key[order][1:] != key[order][:-1]
+        inverse = np.empty(len(order), np.int64)
+        inverse[order] = np.cumsum(new_key) - 1
+
+        firsts = rotated[order[new_key]]
+        images, masks = np.empty(len(firsts), object), np.empty(len(firsts), object)
+        for j, (skin, angle, flying) in enumerate(
+            zip(
+                batch.skin[firsts],
+                batch.angle[firsts].tolist(),
+                batch.flying[firsts].tolist(),
+            )
+        ):
+            images[j], masks[j] = skin.get_rotation(angle, flying)
+        sizes = np.array([mask.get_size() for mask in masks], np.int64)
+
+        bottom = batch.y[rotated] + batch.height[rotated]
+        batch.image[rotated] = images[inverse]
+        batch.mask[rotated] = masks[inverse]
+        batch.width[rotated], batch.height[rotated] = sizes[inverse].T
+        batch.y[rotated] = bottom - batch.height[rotated]
+
+
+def step_batch(batch: BatchState, jump: np.ndarray, level: Level):
+    """Advances every player in the batch by one frame. This gives the same
+    results as calling physics.step() on each player.
+
+    The players that do not overlap any element this frame, which is most of
+    them most of the time, are moved with array operations. The others are
+    stepped one by one with physics.step(), since their collisions depend on
+    the masks of their images.
+
+    Args:
+        batch (BatchState): The players to update in place.
+        jump (np.ndarray): Whether each player holds the jump button.
+        level (Level): The level the players are in.
+    """
+    if COLLIDABLE is None:
+        init_element_arrays()
+
+    active = ~(batch.dead | batch.won)
+    if not active.any():
+        return
+    start = batch.copy()
+
+    batch.frames_alive += active
+
+    # Move x
+    batch.x = np.where(active, batch.x + batch.velocity_x, batch.x)
+
+    # Collisions x are left to physics.step()
+    collided = touches_element(batch, level, active, NEIGHBORS_X)
+
+    # Update velocity.y with gravity
+    rev = batch.gravity_reversed
+    gravity = np.where(batch.flying, GRAVITY / 2, GRAVITY)
+    vy = np.where(
+        rev,
+        np.maximum(batch.velocity_y - gravity, -VELOCITY_MAX_FALL),
+        np.minimum(batch.velocity_y + gravity, VELOCITY_MAX_FALL),
+    )
+    batch.velocity_y = np.where(active, vy, batch.velocity_y)
+
+    # Update velocity.y with jump
+    jump = active & jump
+    if jump.any():
+        tile_ids = lookup(level, batch.x // BLOCK_SIZE, batch.y // BLOCK_SIZE)
+        orb = jump & JUMP_ORB[tile_ids]
+        cube = jump & ~orb & ~batch.flying
+        ship = jump & ~orb & batch.flying
+
+        vy = batch.velocity_y
+        vy = np.where(orb, VELOCITY_JUMP_ORB * np.where(rev, 1, -1), vy)
+        vy = np.where(cube & batch.on_ground & ~rev, -VELOCITY_JUMP, vy)
+        vy = np.where(cube & batch.on_ceiling & rev, VELOCITY_JUMP, vy)
+        vy = np.where(ship & ~rev, np.maximum(vy + -GRAVITY * 5, -GRAVITY * 5), vy)
+        vy = np.where(ship & rev, np.minimum(vy + GRAVITY * 5, GRAVITY * 5), vy)
+        batch.velocity_y = vy
+
+    update_angle(batch, active & ~collided)
+
+    # Move y. np.round() rounds half to even, the same as the built-in round().
+    batch.y = np.where(
+        active, batch.y + np.round(batch.velocity_y).astype(np.int64), batch.y
+    )
+    batch.on_ground &= ~active
+
+    # Check collisions y. Landing on the floor is the only one that does not
+    # need the masks.
+    floor = active & (batch.y + batch.height >= level.floor_level)
+    batch.y = np.where(floor, level.floor_level - batch.height, batch.y)
+    batch.velocity_y[floor] = 0
+    batch.on_ground |= floor
+    collided |= touches_element(batch, level, active & ~floor, NEIGHBORS_Y)
+
+    # Step the players that collided again from the start of the frame
+    for i in np.flatnonzero(collided).tolist():
+        state = start.get(i)
+        step(state, jump[i], level)
+        batch.set(i, state)
@@ -0,0 +1,140 @@
+import numpy as np
+
+from jump_controller import GENOME_SIZE, Net, net_from_genome
+from utils import get_rng
+
+
+class Population:
+    """A population of nets that is evolved with a genetic algorithm.
+
+    The whole generation is one (size, GENOME_SIZE) float32 matrix with a
+    genome per row, and the nets are views of its rows. Selection, crossover
+    and mutation are each a few array operations over the matrix.
+
+    Genomes are never changed once they are in the population. Each
+    generation is a new matrix, so nets from earlier generations (like
+    best_net) keep their weights.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        num_elites: int = 1,
+        selection: str = "tournament",
+        tournament_size: int = 3,
+        crossover_rate: float = 0.5,
+        mutation_strength: float = 2,
+        mutation_freq: float = 0.5,
+        mutation_decay: float = 0.95,
+        min_mutation_strength: float = 0.1,
+        rng: np.random.Generator = None,
+    ):
+        """Creates a population of random nets.
+
+        Args:
+            size (int): The number of nets in each generation.
+            num_elites (int, optional): How many of the best nets are carried
+                over to the next generation unchanged. Defaults to 1.
+            selection (str, optional): How parents are picked, "tournament" or
+                "rank". Defaults to "tournament".
+            tournament_size (int, optional): The number of nets in each
+                tournament. Defaults to 3.
+            crossover_rate (float, optional): The probability that a child has
+                two parents instead of one. Defaults to 0.5.
+            mutation_strength (float, optional): The standard deviation of the
+                mutation in the first generation. Defaults to 2.
+            mutation_freq (float, optional): The probability that each weight
+                is mutated. Defaults to 0.5.
+            mutation_decay (float, optional): How much the mutation strength is
+                multiplied by each generation. Defaults to 0.95.
+            min_mutation_strength (float, optional): The mutation strength
+                never decays below this. Defaults to 0.1.
+            rng (np.random.Generator, optional): The random number generator
+                for everything the GA does. Seed it to make training
+                reproducible. Defaults to None (unseeded).
+        """
+        self.size = size
+        self.num_elites = min(num_elites, size)
+        self.selection = selection
+        self.tournament_size = tournament_size
+        self.crossover_rate = crossover_rate
+        self.mutation_strength = mutation_strength
+        self.mutation_freq = mutation_freq
+        self.mutation_decay = mutation_decay
+        self.min_mutation_strength = min_mutation_strength
+        self.rng = get_rng(rng)
+
+        self.set_genomes(np.stack([Net(rng=self.rng).genome for _ in range(size)]))
+        self.generation = 0
+
+        # The best net and score over all generations so far
+        self.best_net = None
+        self.best_score = None
+
+    def get_mutation_strength(self):
+        return max(
+            self.mutation_strength * self.mutation_decay**self.generation,
+            self.min_mutation_strength,
+        )
+
+    def set_genomes(self, genomes: np.ndarray):
+        """Replaces the generation.
+
+        Args:
+            genomes (np.ndarray): (size, GENOME_SIZE) matrix of genomes.
+        """
+        self.genomes = genomes
+        self.nets = [net_from_genome(genome) for genome in genomes]
+
+    def select(self, scores: np.ndarray, n: int):
+        """Picks parents, favouring the nets with higher scores.
+
+        Args:
+            scores (np.ndarray): The score of each net.
+            n (int): The number of parents to pick.
+
+        Returns:
+            np.ndarray: The indices of the parents.
+        """
+        if self.selection == "rank":
+            # The worst net has weight 1 and the best has weight size
+            ranks = np.argsort(np.argsort(scores)) + 1
+            return self.rng.choice(self.size, n, p=ranks / ranks.sum())
+        contestants = self.rng.integers(0, self.size, (n, self.tournament_size))
+        winners = np.argmax(scores[contestants], axis=1)
+        return contestants[np.arange(n), winners]
+
+    def evolve(self, scores: list[float]):
+        """Replaces the population with the next generation.
+
+        The elites are put at the end of the list. That is where Game puts the
+        player that is drawn with the plain skin at the front of the line.
+
+        Args:
+            scores (list[float]): The score of each net in this generation, in
+                the same order as self.nets.
+        """
+        scores = np.asarray(scores, np.float64)
+        order = np.argsort(-scores, kind="stable")
+        if self.best_score is None or scores[order[0]] > self.best_score:
+            self.best_net = self.nets[order[0]]
+            self.best_score = scores[order[0]]
+
+        num_children = self.size - self.num_elites
+        parents1 = self.genomes[self.select(scores, num_children)]
+        parents2 = self.genomes[self.select(scores, num_children)]
+
+        # Uniform crossover for some of the children, a copy of the first
+        # parent for the rest
+        crossed = self.rng.uniform(size=(num_children, 1)) < self.crossover_rate
+        from_parent2 = self.rng.uniform(size=(num_children, GENOME_SIZE)) < 0.5
+        children = np.where(crossed & from_parent2, parents2, parents1)
+
+        strength = self.get_mutation_strength()
+        mask = self.rng.uniform(size=children.shape) <= self.mutation_freq
+        mutation = mask * (self.rng.standard_normal(children.shape) * strength)
+        children += mutation.astype(np.float32)
+
+        elites = self.genomes[order[: self.num_elites][::-1]]
+        self.set_genomes(np.concatenate([children, elites]))
+        self.generation += 1
@@ -0,0 +1,164 @@
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import time
+
+
+class FrameProfiler:
+    """Times the phases of each frame (event polling, the AI, physics, drawing,
+    ...) and keeps the totals of the last few frames, so the per-phase
+    stats can be shown while the game runs.
+
+    When it is disabled, phase() does nothing and none of the instrumented
+    functions are wrapped, so it costs next to nothing to leave in the loop.
+    """
+
+    def __init__(self, window: int = 60, enabled: bool = False):
+        """Creates a profiler.
+
+        Args:
+            window (int, optional): The number of frames that the stats are
+                over. Defaults to 60 (one second).
+            enabled (bool, optional): Whether to start timing right away.
+                Defaults to False.
+        """
+        self.window = window
+        self.enabled = False
+
+        # dict from phase name to the total time of the phase in each of the
+        # last window frames, in the order the phases were first seen
+        self.history = {}
+        self.frame_times = deque(maxlen=window)
+        self.current = {}  # dict from phase name to its time this frame
+        self.active = None  # the innermost phase that is running
+        self.frame_start = None
+
+        # [(owner, name, phase, within, original function)]
+        self.instrumented = []
+
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        """Starts timing, wrapping the instrumented functions."""
+        if self.enabled:
+            return
+        self.enabled = True
+        for owner, name, phase, within, original in self.instrumented:
+            setattr(owner, name, self.wrap(original, phase, within))
+        self.frame_start = None
+
+    def disable(self):
+        """Stops timing and puts back the instrumented functions. The stats
+        are cleared, since they would be stale the next time.
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        for owner, name, _, _, original in self.instrumented:
+            setattr(owner, name, original)
+        self.history.clear()
+        self.frame_times.clear()
+        self.current.clear()
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def instrument(self, owner, name: str, phase: str, within: str = None):
+        """Times every call of a function that is looked up by name, e.g.
+        physics.check_collisions_x, while the profiler is enabled.
+
+        Args:
+            owner (module | class): What the function is an attribute of.
+            name (str): The name of the function.
+            phase (str): The phase to add the time of the calls to.
+            within (str, optional): Only time the calls made while this phase
+                is running. For example, the collisions of Player.update and
+                not those of the AI's lookahead. Defaults to None (every call).
+        """
+        original = getattr(owner, name)
+        self.instrumented.append((owner, name, phase, within, original))
+        if self.enabled:
+            setattr(owner, name, self.wrap(original, phase, within))
+
+    def wrap(self, fn, phase: str, within: str = None):
+        def timed(*args, **kwargs):
+            if within is not None and self.active != within:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+
+        return timed
+
+    def add(self, phase: str, seconds: float):
+        self.current[phase] = self.current.get(phase, 0) + seconds
+
+    @contextmanager
+    def timed_phase(self, name: str):
+        parent, self.active = self.active, name
+        self.current.setdefault(name, 0)  # so phases are listed as they start
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            self.active = parent
+
+    def phase(self, name: str):
+        """Times the code in a with block as part of a phase. A phase can be
+        timed several times in a frame, and the times are added up.
+
+        Args:
+            name (str): The name of the phase.
+
+        Returns:
+            context manager: Use it in a with statement.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self.timed_phase(name)
+
+    def end_frame(self):
+        """Ends the current frame, adding its phase times to the stats. Call it
+        once per frame, at the same point in the loop.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.frame_times.append(now - self.frame_start)
+        self.frame_start = now
+
+        for phase in self.current:
+            if phase not in self.history:
+                self.history[phase] = deque(maxlen=self.window)
+        for phase, times in self.history.items():
+            times.append(self.current.get(phase, 0))
+        self.current = {}
+
+    def get_stats(self):
+        """Returns the stats of each phase over the last window frames.
+
+        Returns:
+            list[tuple]: (phase, mean ms, max ms) per phase, then the same for
+                the whole frame (including the time spent waiting for the
+                next one) as "frame".
+        """
+        stats = [
+            (phase, 1000 * sum(times) / len(times), 1000 * max(times))
+            for phase, times in self.history.items()
+        ]
+        if self.frame_times:
+            stats.append(
+                (
+                    "frame",
+                    1000 * sum(self.frame_times) / len(self.frame_times),
+                    1000 * max(self.frame_times),
+                )
+            )
+        return stats
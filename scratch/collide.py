@@ -1,10 +1,11 @@
-import math
-
+import numpy as np
 import pygame
 from pygame.math import Vector2
 
-from config import BLOCK_SIZE, CollisionType
+from assets import get_element_asset
+from config import BLOCK_SIZE
 from jump_controller import JumpControllerManual
+from level import Level
 from sprites.basic import ElementSprite
 from sprites.player import Player
 from utils import FillType, load_image
@@ -16,17 +17,18 @@ screen = pygame.display.set_mode(size)
 clock = pygame.time.Clock()
 
 player = Player(
-    (size[0] / 2, size[1] / 2 - BLOCK_SIZE),
+    (BLOCK_SIZE * 5, BLOCK_SIZE * 4),
     Vector2(0, 0),
     load_image(f"assets/players/player-0.png"),
     load_image(f"assets/ships/ship-1.png", fill_type=FillType.SHIP),
     JumpControllerManual(),
 )
-element = ElementSprite(
-    (size[0] / 2, size[1] / 2),
-    load_image("assets/elements/element-1.png"),
-    CollisionType.SOLID,
-)
+element = ElementSprite((BLOCK_SIZE * 5, BLOCK_SIZE * 5), get_element_asset("1"))
+
+# The same block as a level, with the floor one block above the bottom
+map = np.zeros((size[1] // BLOCK_SIZE - 1, size[0] // BLOCK_SIZE), np.uint8)
+map[5, 5] = 1
+level = Level(map)
 
 
 done = False
@@ -44,7 +46,7 @@ while not done:
                     next_frame = True
 
     print("player", player.rect, player.rect.bottom)
-    print("  velocity", player.velocity)
+    print("  velocity", player.state.velocity_x, player.state.velocity_y)
     print("element", element.rect, element.rect.top)
 
     screen.fill(0)
@@ -52,7 +54,7 @@ while not done:
     screen.blit(player.image, player.rect)
     screen.blit(element.image, element.rect)
 
-    player.update({(5, 5): element}, size[1] - BLOCK_SIZE)
+    player.update(level)
 
     print()
 
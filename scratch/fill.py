@@ -1,7 +1,8 @@
 import pygame
 from pygame.math import Vector2
 
-from config import BLOCK_SIZE, CollisionType
+from assets import get_element_asset
+from config import BLOCK_SIZE
 from sprites.basic import ElementSprite
 from sprites.player import Player
 from utils import FillType, load_image
@@ -19,11 +20,7 @@ player = Player(
     load_image(f"assets/ships/ship-1.png", fill_type=FillType.SHIP),
     flying=False,
 )
-element = ElementSprite(
-    (size[0] / 2, size[1] / 2),
-    load_image("assets/elements/element-1.png"),
-    CollisionType.SOLID,
-)
+element = ElementSprite((size[0] / 2, size[1] / 2), get_element_asset("1"))
 
 
 done = False
@@ -35,7 +32,7 @@ while not done:
 
     screen.fill((43,91,168))
 
-    screen.blit(player.ship_image if player.flying else player.image, player.rect)
+    screen.blit(player.image, player.rect)
     screen.blit(element.image, element.rect)
 
     pygame.display.flip()
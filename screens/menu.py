@@ -3,6 +3,7 @@ import pygame
 from config import SCREEN_SIZE, LEVELS
 from components.button import Button
 from components.text import Text
+from display import DirtyRects
 
 
 def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
@@ -36,6 +37,7 @@ def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
         
         Press "s" or click the Simulate button to run an AI on the level.
         The AI is trained using a genetic algorithm.
+        Press "c" to continue the last simulation of the level.
         
         Controls:
         - space: jump
@@ -49,7 +51,11 @@ def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
             Text(line, midleft=(SCREEN_SIZE[0] / 4, SCREEN_SIZE[1] - 10 - i * 20))
         )
 
-    go_to_play, go_to_simulate = False, False
+    # Only the buttons (when hovered) and the title (when the level changes)
+    # change between frames
+    dirty_rects = DirtyRects()
+
+    go_to_play, go_to_simulate, resume = False, False, False
     while not go_to_play and not go_to_simulate:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -71,6 +77,8 @@ def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
                     go_to_play = True
                 elif event.key == pygame.K_s:
                     go_to_simulate = True
+                elif event.key == pygame.K_c:
+                    go_to_simulate, resume = True, True
                 elif event.key == pygame.K_LEFT:
                     level_id = (level_id - 1) % len(LEVELS)
                     title.text = f"Level {level_id + 1}: {LEVELS[level_id]['name']}"
@@ -81,15 +89,18 @@ def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
         # Redraw
         screen.blit(background, (0, 0))
 
-        title.draw(screen)
-        play_button.draw(screen)
-        simulate_button.draw(screen)
-        prev_button.draw(screen)
-        next_button.draw(screen)
+        dirty_rects.add(
+            title.draw(screen),
+            play_button.draw(screen),
+            simulate_button.draw(screen),
+            prev_button.draw(screen),
+            next_button.draw(screen),
+        )
         for text in explainer_text:
             text.draw(screen)
 
-        pygame.display.update()
+        dirty_rects.update()
+        clock.tick(60)
 
     if go_to_play:
         from screens.play import play
@@ -98,4 +109,4 @@ def menu(screen: pygame.Surface, clock: pygame.time.Clock, level_id: int = 0):
     elif go_to_simulate:
         from screens.play import play
 
-        play(screen, clock, level_id, simulate=True)
+        play(screen, clock, level_id, simulate=True, resume=resume)
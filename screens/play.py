@@ -1,17 +1,30 @@
+import os
 import time
 
+import numpy as np
 import pygame
 
 from components.button import Button
 from components.rounded_rect import RoundedRect
 from components.text import Text
-from config import SCREEN_SIZE, VELOCITY_X
+from checkpoint import get_checkpoint_filename, load_checkpoint, save_checkpoint
+from config import (
+    CHECKPOINT_INTERVAL,
+    SCREEN_SIZE,
+    SEED,
+    SIMULATE_MAX_FRAMES,
+    VELOCITY_X,
+)
+from display import DirtyRects
 from game import Game
+import physics
+from population import Population
+from profiler import FrameProfiler
 from utils import load_map
 
 
 def get_events(pause_button: Button = None):
-    r, p, d, m, n, left, right = False, False, False, False, False, False, False
+    r, p, d, m, f, n, left, right = [False] * 8
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             pygame.quit()
@@ -30,6 +43,8 @@ def get_events(pause_button: Button = None):
                 d = True
             elif event.key == pygame.K_m:
                 m = True
+            elif event.key == pygame.K_f:
+                f = True
     keys = pygame.key.get_pressed()
     if keys[pygame.K_n]:
         n = True
@@ -37,13 +52,13 @@ def get_events(pause_button: Button = None):
         left = True
     if keys[pygame.K_RIGHT]:
         right = True
-    return r, p, d, m, n, left, right
+    return r, p, d, m, f, n, left, right
 
 
-def debug_loop(screen, clock, game, pause, pause_button):
+def debug_loop(screen, clock, game, pause, pause_button, dirty_rects):
     restart, debug, go_to_menu = False, True, False
     while debug:
-        restart, p, d, m, next_frame, left, right = get_events(pause_button)
+        restart, p, d, m, f, next_frame, left, right = get_events(pause_button)
 
         if p:
             pause = not pause
@@ -51,30 +66,33 @@ def debug_loop(screen, clock, game, pause, pause_button):
             debug = False
         if pause and m:  # can only go to menu when paused
             go_to_menu = True
+        if f:
+            game.profiler.toggle()
         if not pause:  # cannot move the camera when paused
             if left:
                 game.camera.x -= VELOCITY_X * 15
             if right:
                 game.camera.x += VELOCITY_X * 15
 
-        draw_debug(screen)
+        dirty_rects.add(*draw_debug(screen))
         # if not pause:
         pause_button.text = "Play" if pause else "Pause"
-        pause_button.draw(screen)
+        dirty_rects.add(pause_button.draw(screen))
 
         """Under these conditions, run the main loop once and come back. The
         value of debug will still be True.
             restart     - the game should restart
             p           - the pause status changed
             go_to_menu  - go to main menu
+            f           - the performance overlay was toggled
             next_frame  - the game should advance one frame
             left        - the camera should move left
             right       - the camera should move right
         """
-        if restart or p or go_to_menu or next_frame or left or right:
+        if restart or p or go_to_menu or f or next_frame or left or right:
             break
 
-        pygame.display.update()
+        dirty_rects.update()
         clock.tick(15)
     return restart, pause, debug, next_frame, go_to_menu
 
@@ -82,10 +100,41 @@ def debug_loop(screen, clock, game, pause, pause_button):
 def draw_debug(screen):
     red = (255, 0, 0)
     x = SCREEN_SIZE[0] - 25
-    Text("Debug mode", color=red, topright=(x, 65)).draw(screen)
-    Text("d - debug mode off", color=red, topright=(x, 85)).draw(screen)
-    Text("n - next frame", color=red, topright=(x, 105)).draw(screen)
-    Text("left/right arrows - move camera", color=red, topright=(x, 125)).draw(screen)
+    lines = [
+        "Debug mode",
+        "d - debug mode off",
+        "n - next frame",
+        "left/right arrows - move camera",
+        "f - performance overlay",
+    ]
+    return [
+        Text(line, color=red, topright=(x, 65 + i * 20)).draw(screen)
+        for i, line in enumerate(lines)
+    ]
+
+
+def draw_perf(screen, clock, profiler: FrameProfiler):
+    """Draws the FPS and how long each phase of a frame took on average and at
+    most over the last second.
+
+    Returns:
+        list[pygame.Rect]: The rects of the lines.
+    """
+    red = (255, 0, 0)
+    x, y = SCREEN_SIZE[0] - 25, 175
+    rects = [
+        Text(f"FPS: {clock.get_fps():.1f}", color=red, topright=(x, y)).draw(screen)
+    ]
+    for phase, mean_ms, max_ms in profiler.get_stats():
+        y += 20
+        rects.append(
+            Text(
+                f"{phase}: {mean_ms:.2f}ms (max {max_ms:.2f}ms)",
+                color=red,
+                topright=(x, y),
+            ).draw(screen)
+        )
+    return rects
 
 
 def draw_pause(screen):
@@ -108,6 +157,8 @@ def play(
     clock: pygame.time.Clock,
     level_id: int,
     simulate: bool = False,
+    resume: bool = False,
+    max_frames: int = SIMULATE_MAX_FRAMES,
 ):
     """This function is the main loop for one level of the game. It creates a
     Game object and handles all of the controls and drawing for pausing,
@@ -118,6 +169,12 @@ def play(
         clock (pygame.time.Clock): _description_
         level_id (int): _description_
         simulate (bool, optional): _description_. Defaults to False.
+        resume (bool, optional): Whether to continue the simulation from the
+            Simulate screen's last checkpoint of the level, if there is one.
+            train.py's checkpoints are kept apart. Defaults to False.
+        max_frames (int, optional): The most frames a generation runs for
+            when simulating. Players that are still running then are scored by
+            how far they got. Defaults to SIMULATE_MAX_FRAMES.
 
     Returns:
         _type_: _description_
@@ -126,78 +183,137 @@ def play(
     num_manual_players = 0 if simulate else 1
     num_ai_players = 20 if simulate else 0
     best_ai_player = None
+    population = (
+        Population(num_ai_players, rng=np.random.default_rng(SEED))
+        if simulate
+        else None
+    )
+    checkpoint_filename = get_checkpoint_filename(level_id, simulate=True)
+    attempt_num = 1
+    total_time = 0
+    if simulate and resume and os.path.exists(checkpoint_filename):
+        population, total_time = load_checkpoint(checkpoint_filename)
+        num_ai_players = population.size
+        attempt_num = population.generation + 1
 
-    def new_game():
-        return Game(map, num_manual_players, num_ai_players, best_ai_player)
+    def get_nets():
+        return population.nets if simulate else None
 
-    game: Game = new_game()
-    attempt_num = 1
+    # The AI players always jump when their nets say so, since the population
+    # is evolved on their scores
+    game = Game(
+        map,
+        num_manual_players,
+        num_ai_players,
+        nets=get_nets(),
+        seed=SEED,
+        use_net=True,
+    )
+    profiler = game.profiler
+    # Only the collisions of the actual moves, not those of the AI's lookahead
+    profiler.instrument(physics, "check_collisions_x", "collisions", "player_update")
+    profiler.instrument(physics, "check_collisions_y", "collisions", "player_update")
     game_start = time.time()
-    total_start = time.time() # TODO: pause the timer if the game is paused
+    num_frames = 0  # the number of frames of this attempt or generation
+    total_start = time.time() - total_time # TODO: pause the timer if the game is paused
 
     pause_button = Button(SCREEN_SIZE[0] - 95, 25, 70, 30, "Pause", 20)
+    # While the level scrolls the whole screen changes, but when it is paused
+    # only the timers, the button and the overlays do
+    dirty_rects = DirtyRects()
+    last_view = None  # the camera, pause and overlay state of the last frame
 
     pause, debug, next_frame, go_to_menu = False, False, False, False
     while True:
-        restart, p, d, go_to_menu, *_ = get_events(pause_button)
+        with profiler.phase("events"):
+            restart, p, d, go_to_menu, *_ = get_events(pause_button)
         if d:
             debug = not debug
         if debug:
             restart, pause, debug, next_frame, go_to_menu = debug_loop(
-                screen, clock, game, pause, pause_button
+                screen, clock, game, pause, pause_button, dirty_rects
             )
         if restart:
             pause = False
-            game: Game = new_game()
+            game.reset(best_ai_player, get_nets())
             if not simulate:  # don't count as new attempt if simulating
                 attempt_num += 1
             game_start = time.time()
+            num_frames = 0
         if p:
             pause = not pause
         if pause and go_to_menu:
             break
 
-        if not pause and (not debug or next_frame):
+        scrolled = not pause and (not debug or next_frame)
+        if scrolled:
             # Update the game
             game.update()
 
-            # Check game status
-            if game.all_dead():
+            num_frames += 1
+
+            # Check game status. The attempt or generation is over when every
+            # player has died or run past the end of the level (some levels
+            # have no end), or when a generation is out of frames.
+            if winner := game.get_winner():
                 if simulate:
-                    furthest_player = max(
-                        game.player_sprite_group.sprites(), key=lambda p: p.score
-                    )
+                    best_ai_player = winner.clone()
+                    pause = True  # TODO: add a won screen
+            elif game.all_finished() or (
+                simulate and max_frames is not None and num_frames >= max_frames
+            ):
+                if simulate:
+                    ai_players = game.player_sprite_group.sprites()
+                    furthest_player = max(ai_players, key=game.get_score)
                     if (
                         not best_ai_player
-                        or furthest_player.score > best_ai_player.score
+                        or game.get_score(furthest_player)
+                        > game.get_score(best_ai_player)
                     ):
-                        best_ai_player = furthest_player
+                        # Keep a copy since the game's players are reset
+                        best_ai_player = furthest_player.clone()
+                    population.evolve(
+                        [game.get_score(player) for player in ai_players]
+                    )
+                    if population.generation % CHECKPOINT_INTERVAL == 0:
+                        save_checkpoint(
+                            checkpoint_filename, population, time.time() - total_start
+                        )
                 pause = False
-                game: Game = new_game()
+                game.reset(best_ai_player, get_nets())
                 attempt_num += 1
                 game_start = time.time()
-            elif simulate and (winner := game.get_winner()):
-                best_ai_player = winner
-                pause = True  # TODO: add a won screen
+                num_frames = 0
 
         # Redraw
         game_time = time.time() - game_start
         total_time = time.time() - total_start
-        game.draw(screen, attempt_num, game_time, total_time, simulate)
+        with profiler.phase("draw"):
+            dirty_rects.add(
+                *game.draw(screen, attempt_num, game_time, total_time, simulate)
+            )
 
         if pause:
             draw_pause(screen)
         # else:
         pause_button.text = "Play" if pause else "Pause"
-        pause_button.draw(screen)
+        dirty_rects.add(pause_button.draw(screen))
         if debug:
-            draw_debug(screen)
-            
-        # TODO: display FPS (clock.get_fps())
+            dirty_rects.add(*draw_debug(screen))
+        if profiler.enabled:
+            dirty_rects.add(*draw_perf(screen, clock, profiler))
 
-        pygame.display.flip()
+        # Everything moves when the level scrolls, the game restarts or the
+        # camera moves, the pause screen covers everything, and an overlay that
+        # was turned off leaves a hole that the game was redrawn into
+        view = (game.camera.x, game.camera.y, pause, debug, profiler.enabled)
+        with profiler.phase("flip"):
+            dirty_rects.update(full=scrolled or restart or view != last_view)
+        last_view = view
         clock.tick(60)
+        profiler.end_frame()
 
+    profiler.disable()  # put back the instrumented functions
     from screens.menu import menu
 
     menu(screen, clock, level_id=level_id)
@@ -1,10 +1,11 @@
 from __future__ import annotations
+from typing import TYPE_CHECKING
 
 import pygame
 from pygame.math import Vector2
 
-
-from config import CollisionType
+if TYPE_CHECKING:
+    from assets import ElementAsset
 
 
 class Sprite(pygame.sprite.Sprite):
@@ -14,10 +15,16 @@ class Sprite(pygame.sprite.Sprite):
 
 
 class ImageSprite(Sprite):
-    def __init__(self, position: tuple, image: pygame.Surface, *groups):
+    def __init__(
+        self,
+        position: tuple,
+        image: pygame.Surface,
+        *groups,
+        mask: pygame.mask.Mask = None,
+    ):
         super().__init__(position, *groups)
         self.image = image
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = mask if mask is not None else pygame.mask.from_surface(self.image)
         centered_position = (
             position[0] + image.get_width() / 2,
             position[1] + image.get_height() / 2,
@@ -41,9 +48,15 @@ class TiledSprite(ImageSprite):
         super().__init__(position, image, *groups)
         self.velocity = velocity
         self.num_siblings = num_siblings
+        self.start_position = position
         self.rect.x = self.position[0]
         self.rect.y = self.position[1]
 
+    def reset(self):
+        """Moves the image back to where it started."""
+        self.position = self.start_position
+        self.rect.x = self.position[0]
+
     def update(self):
         self.position = (self.position[0] - self.velocity.x, self.position[1])
         if self.position[0] <= -self.image.get_width():
@@ -55,12 +68,11 @@ class TiledSprite(ImageSprite):
 
 
 class ElementSprite(ImageSprite):
-    def __init__(
-        self,
-        position: tuple,
-        image: pygame.Surface,
-        collision_type: CollisionType = CollisionType.NONE,
-        *groups,
-    ):
-        super().__init__(position, image, *groups)
-        self.collision_type = collision_type
+    """An element of the map. The image and mask are shared with every other
+    sprite of the same element.
+    """
+
+    def __init__(self, position: tuple, asset: ElementAsset, *groups):
+        super().__init__(position, asset.image, *groups, mask=asset.mask)
+        self.asset = asset
+        self.collision_type = asset.collision_type
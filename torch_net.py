@@ -0,0 +1,62 @@
+import copy
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from utils import get_rng
+
+
+class TorchNet(nn.Module):
+    """The PyTorch version of jump_controller.Net. It is only imported when
+    config.AI_NET_BACKEND is "torch", since importing torch is slow.
+    """
+
+    def __init__(self):
+        super(TorchNet, self).__init__()
+
+        # 5 inputs, size 3 hidden layer, 1 output
+        self.fc1 = nn.Linear(5, 3)
+        self.fc2 = nn.Linear(3, 1)
+
+    def forward(self, x):
+        x = torch.as_tensor(x)
+        # x = F.relu(self.fc1(x))
+        # x = F.relu(self.fc2(x))
+        x = torch.sigmoid(x)
+        x = torch.sigmoid(self.fc1(x))
+        x = torch.sigmoid(self.fc2(x))
+        return x
+
+    def copy(self):
+        """Returns a new net with a copy of the weights.
+
+        Returns:
+            TorchNet: The copied net.
+        """
+        return copy.deepcopy(self)
+
+    def mutate(self, strength: float, freq: float, rng: np.random.Generator = None):
+        """Adds random noise to some of the weights in place. The noise comes
+        from a NumPy generator so that both backends can be seeded the same way.
+
+        Args:
+            strength (float): The standard deviation of the noise.
+            freq (float): The probability that each weight is mutated.
+            rng (np.random.Generator, optional): The random number generator.
+                Defaults to None (unseeded).
+        """
+        rng = get_rng(rng)
+        with torch.no_grad():
+            for param in self.parameters():
+                mask = rng.uniform(size=param.shape) <= freq
+                mutation = mask * (rng.standard_normal(param.shape) * strength)
+                param.data += torch.as_tensor(mutation, dtype=param.dtype)
+
+    def load_state_dict(self, state_dict: dict, strict: bool = True):
+        # Also accept the NumPy arrays of jump_controller.Net.state_dict()
+        return super().load_state_dict(
+            {key: torch.as_tensor(value) for key, value in state_dict.items()},
+            strict,
+        )
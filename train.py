@@ -0,0 +1,92 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from checkpoint import get_checkpoint_filename, load_checkpoint, save_checkpoint
+from config import BLOCK_SIZE, CHECKPOINT_INTERVAL, LEVELS, SEED
+from evaluator import Evaluator
+from population import Population
+from utils import load_map
+
+
+def train(
+    level_id: int,
+    num_generations: int,
+    population_size: int = 100,
+    max_frames: int = None,
+    max_workers: int = None,
+    resume: bool = False,
+    seed: int = SEED,
+):
+    """Trains a population on a level without a window, using every core. A
+    checkpoint is saved every CHECKPOINT_INTERVAL generations and at the end.
+
+    Args:
+        level_id (int): The index of the level in LEVELS.
+        num_generations (int): The generation to train until.
+        population_size (int, optional): The number of nets per generation.
+            Ignored when resuming. Defaults to 100.
+        max_frames (int, optional): The maximum number of frames per
+            generation. Players that are still running when a generation is
+            cut off are scored by their position. Defaults to None (no limit).
+        max_workers (int, optional): The number of worker processes. Defaults
+            to the number of CPUs.
+        resume (bool, optional): Whether to continue from the level's last
+            checkpoint, if there is one. Defaults to False.
+        seed (int, optional): The seed for the GA. Ignored when resuming, since
+            the checkpoint has the state of the random number generator.
+            Defaults to SEED.
+    """
+    map = load_map(level_id)
+    checkpoint_filename = get_checkpoint_filename(level_id)
+    population = Population(population_size, rng=np.random.default_rng(seed))
+    total_time = 0
+    if resume and os.path.exists(checkpoint_filename):
+        population, total_time = load_checkpoint(checkpoint_filename)
+        print(f"Resuming from generation {population.generation}")
+
+    start = time.time() - total_time
+    with Evaluator(map, max_frames, max_workers) as evaluator:
+        while population.generation < num_generations:
+            results = evaluator.evaluate(population.nets)
+            population.evolve([result.score for result in results])
+
+            best_score = max(result.score for result in results)
+            print(
+                f"Generation {population.generation}:",
+                f"best {100 * best_score / (len(map[0]) * BLOCK_SIZE):.2f}%,",
+                f"{time.time() - start:.1f}s",
+            )
+            if population.generation % CHECKPOINT_INTERVAL == 0:
+                save_checkpoint(checkpoint_filename, population, time.time() - start)
+    save_checkpoint(checkpoint_filename, population, time.time() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the AI without a window.")
+    parser.add_argument("level_id", type=int, choices=range(len(LEVELS)))
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--population", type=int, default=100)
+    parser.add_argument(
+        "--max-frames",
+        type=int,
+        default=None,
+        help="Cut each generation off after this many frames. Players that are "
+        "still running are scored by how far they got.",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    train(
+        args.level_id,
+        args.generations,
+        args.population,
+        args.max_frames,
+        args.workers,
+        args.resume,
+        args.seed,
+    )
@@ -1,11 +1,11 @@
+from collections import OrderedDict
 import csv
 from enum import Enum
 import os
-import random
 from typing import Tuple
 
+import numpy as np
 import pygame
-from pygame.math import Vector2
 
 from config import BLOCK_SIZE, LEVELS, PALETTE
 
@@ -52,20 +52,25 @@ def fill_player(
         color2 (Tuple[int, int, int]): The secondary color.
     """
     w, h = image.get_size()
-    r1, g1, b1 = color1
-    r2, g2, b2 = color2
     border_width = 2
-    for x in range(border_width, w - border_width):
-        for y in range(border_width, h - border_width):
-            r, g, b, a = image.get_at((x, y))
-            if close_to_black((r, g, b)) and a > 50:
-                image.set_at((x, y), pygame.Color(0, 0, 0, 255))
-            elif (r, g, b) == (0, 0, 0):
-                image.set_at((x, y), pygame.Color(r2, g2, b2, 255))
-            elif a == 0:
-                image.set_at((x, y), pygame.Color(r2, g2, b2, 255))
-            else:
-                image.set_at((x, y), pygame.Color(r1, g1, b1, 255))
+    inside = (
+        slice(border_width, w - border_width),
+        slice(border_width, h - border_width),
+    )
+    rgb = pygame.surfarray.pixels3d(image)[inside]
+    alpha = pygame.surfarray.pixels_alpha(image)[inside]
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    # The same rules as close_to_black(), applied to every pixel at once
+    gray = (r == g) & (r == b)
+    outline = gray & (r < 150) & (alpha > 50)
+    gap = ~outline & (((r == 0) & (g == 0) & (b == 0)) | (alpha == 0))
+    body = ~outline & ~gap
+
+    rgb[outline] = (0, 0, 0)
+    rgb[gap] = color2
+    rgb[body] = color1
+    alpha[...] = 255
 
 
 def fill_ship(
@@ -81,13 +86,34 @@ def fill_ship(
         color1 (Tuple[int, int, int]): The primary color.
         color2 (Tuple[int, int, int]): The secondary color.
     """
-    w, h = image.get_size()
-    r1, g1, b1 = color1
-    for x in range(w):
-        for y in range(h):
-            r, g, b, _ = image.get_at((x, y))
-            if close_to_white((r, g, b)):
-                image.set_at((x, y), pygame.Color(r1, g1, b1, 255))
+    rgb = pygame.surfarray.pixels3d(image)
+    alpha = pygame.surfarray.pixels_alpha(image)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    # The same rules as close_to_white(), applied to every pixel at once
+    body = (r == g) & (r == b) & (r > 150)
+
+    rgb[body] = color1
+    alpha[body] = 255
+
+
+def premultiply_alpha(image: pygame.Surface):
+    """Returns a copy of an image with its colors multiplied by its alpha, for
+    blitting with pygame.BLEND_PREMULTIPLIED. Blending premultiplied images
+    onto a transparent surface and then blending that surface gives the same
+    result as blending the images directly.
+
+    Args:
+        image (pygame.Surface): An image with per-pixel alpha.
+
+    Returns:
+        pygame.Surface: The premultiplied copy.
+    """
+    image = image.copy()
+    rgb = pygame.surfarray.pixels3d(image)
+    alpha = pygame.surfarray.pixels_alpha(image)
+    rgb[...] = (rgb * (alpha[..., np.newaxis] / 255) + 0.5).astype(np.uint8)
+    return image
 
 
 class FillType(Enum):
@@ -96,15 +122,54 @@ class FillType(Enum):
     SHIP = 3
 
 
+# The number of filled images to keep. A game only loads a couple per player.
+MAX_FILLED_IMAGES = 128
+
+# dict from (filename, size, fill_type, color1, color2) to the filled image,
+# from least to most recently used
+filled_images = OrderedDict()
+
+# Used when no random number generator is passed in, so it is not seeded
+default_rng = np.random.default_rng()
+
+
+def get_rng(rng: np.random.Generator = None):
+    """Returns the given random number generator, or a shared unseeded one if
+    it is None.
+
+    Args:
+        rng (np.random.Generator, optional): The generator. Defaults to None.
+
+    Returns:
+        np.random.Generator: The generator to use.
+    """
+    return rng if rng is not None else default_rng
+
+
+def random_color(rng: np.random.Generator = None):
+    """Returns a random color from the palette.
+
+    Args:
+        rng (np.random.Generator, optional): The random number generator.
+            Defaults to None (unseeded).
+
+    Returns:
+        Tuple[int, int, int]: The color.
+    """
+    return PALETTE[get_rng(rng).integers(len(PALETTE))]
+
+
 def load_image(
     filename: str,
     size: Tuple[int, int] = (BLOCK_SIZE, BLOCK_SIZE),
     fill_type: FillType = FillType.NONE,
     color1: Tuple[int, int, int] = None, # = (2, 255, 0),
     color2: Tuple[int, int, int] = None, # = (2, 255, 255),
+    rng: np.random.Generator = None,
 ):
     """Loads an image from the given filename, resizes it, and adds color if
-    fill_tyep is not FillType.NONE.
+    fill_tyep is not FillType.NONE. The last MAX_FILLED_IMAGES filled images
+    are cached and shared, so they must not be modified.
 
     Args:
         filename (str): The image filename.
@@ -116,62 +181,85 @@ def load_image(
             (2, 255, 0).
         color2 (Tuple[int, int, int], optional): The secondary color. Defaults
             to (2, 255, 255).
+        rng (np.random.Generator, optional): The random number generator for
+            colors that are not given. Defaults to None (unseeded).
 
     Returns:
         pygame.Surface: The loaded image.
     """
     if os.path.exists(filename):
+        if fill_type == FillType.NONE:
+            return resize_image(pygame.image.load(filename), size)
+
+        color1 = color1 if color1 else random_color(rng)
+        color2 = color2 if color2 else random_color(rng)
+        # Ships only use the first color
+        key = (
+            filename,
+            tuple(size),
+            fill_type,
+            tuple(color1),
+            tuple(color2) if fill_type != FillType.SHIP else None,
+        )
+        image = filled_images.get(key)
+        if image is not None:
+            filled_images.move_to_end(key)
+            return image
+
         image = resize_image(pygame.image.load(filename), size)
-        color1 = color1 if color1 else random.choice(PALETTE)
-        color2 = color2 if color2 else random.choice(PALETTE)
         match fill_type:
             case FillType.PLAYER:
                 fill_player(image, color1, color2)
             case FillType.SHIP:
                 fill_ship(image, color1, color2)
+        filled_images[key] = image
+        while len(filled_images) > MAX_FILLED_IMAGES:
+            filled_images.popitem(last=False)
         return image
     return None
 
 
-def load_map(level_id: int):
-    filename = LEVELS[level_id]["filename"]
-    with open(filename) as f:
-        reader = csv.reader(f)
-        map = []
-        for row in reader:
-            r = []
-            for cell in row:
-                r.append(cell)
-            map.append(r)
-    return map
+def parse_map(filename: str):
+    """Parses a map CSV where each cell is an element id.
 
+    Args:
+        filename (str): The CSV filename.
 
-def rotate_image(
-    original_image: pygame.Surface,
-    surf_pivot: Vector2,
-    image_pivot: Vector2,
-    angle: float,
-):
-    """Sets self.image and self.rect to the rotate position for self.original_image.
+    Returns:
+        np.ndarray: 2D uint8 array of element ids.
+    """
+    with open(filename) as f:
+        return np.array([row for row in csv.reader(f)]).astype(np.uint8)
 
-    See https://stackoverflow.com/a/59909946 for details.
+
+def load_map(level_id: int):
+    """Loads the map of a level. The parsed map is compiled to a .npy file
+    next to the CSV so later loads only have to memory-map it. The compiled
+    file is rebuilt whenever the CSV is newer than it.
 
     Args:
-        original_image (pygame.Surface): The image to rotate.
-        surf_pivot (Vector2): The position of the pivot point relative to the surface.
-        image_pivot (Vector2): The position of the pivot point relative to the image.
-        angle (float): The angle to rotate the image by.
+        level_id (int): The index of the level in LEVELS.
+
+    Returns:
+        np.ndarray: 2D uint8 array of element ids (read-only).
     """
-    image_rect = original_image.get_rect(
-        topleft=(surf_pivot[0] - image_pivot[0], surf_pivot[1] - image_pivot[1])
-    )
-    offset_center_to_pivot = Vector2(surf_pivot) - image_rect.center
-    rotated_offset = offset_center_to_pivot.rotate(-angle)
-    rotated_image_center = (
-        surf_pivot[0] - rotated_offset.x,
-        surf_pivot[1] - rotated_offset.y,
-    )
-    rotated_image = pygame.transform.rotate(original_image, angle)
-    rotated_image_rect = rotated_image.get_rect(center=rotated_image_center)
+    filename = LEVELS[level_id]["filename"]
+    compiled_filename = os.path.splitext(filename)[0] + ".npy"
+    if os.path.exists(compiled_filename) and os.path.getmtime(
+        compiled_filename
+    ) >= os.path.getmtime(filename):
+        return np.load(compiled_filename, mmap_mode="r")
+
+    map = parse_map(filename)
+    try:
+        # Write to a temporary file first so that a half-written file is
+        # never loaded
+        tmp_filename = f"{compiled_filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "wb") as f:
+            np.save(f, map)
+        os.replace(tmp_filename, compiled_filename)
+    except OSError:
+        pass  # e.g. the maps directory is read-only
+    map.flags.writeable = False
+    return map
 
-    return rotated_image, rotated_image_rect